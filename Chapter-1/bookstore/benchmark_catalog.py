@@ -0,0 +1,74 @@
+import random
+import statistics
+import time
+
+from fastapi.testclient import TestClient
+
+from main import app, catalog, response_cache
+from model import Book
+
+SIZES = [10_000, 100_000, 1_000_000]
+N_AUTHORS = 5_000
+YEARS = range(1901, 2100)
+
+
+def fill_catalog(n_books: int):
+    catalog.clear()
+    response_cache.invalidate()
+    catalog.extend(
+        Book(
+            title=f"Book {i}",
+            author=f"Author {i % N_AUTHORS}",
+            year=YEARS[i % len(YEARS)],
+        )
+        for i in range(n_books)
+    )
+
+
+def percentiles(samples: list[float]) -> tuple[float, float]:
+    cuts = statistics.quantiles(samples, n=100)
+    return cuts[49] * 1000, cuts[98] * 1000
+
+
+def time_endpoint(client: TestClient, make_path, n_requests: int):
+    samples = []
+    for _ in range(n_requests):
+        path = make_path()
+        begin = time.perf_counter()
+        response = client.get(path)
+        samples.append(time.perf_counter() - begin)
+        assert response.status_code == 200, path
+    return percentiles(samples)
+
+
+def main(n_requests: int = 1000):
+    client = TestClient(app)
+    for size in SIZES:
+        begin = time.perf_counter()
+        fill_catalog(size)
+        print(f"\n{size} books loaded in "
+              f"{time.perf_counter() - begin:.1f} seconds")
+        endpoints = {
+            "/books/{book_id}": lambda: (
+                f"/books/{random.randint(1, size)}"
+            ),
+            "/authors/{author_id}": lambda: (
+                f"/authors/{random.randint(1, N_AUTHORS)}?limit=20"
+            ),
+            "/books?year=": lambda: (
+                f"/books?year={random.choice(YEARS)}&limit=20"
+            ),
+            "/books?after_id=": lambda: (
+                f"/books?after_id={random.randint(1, size)}&limit=20"
+            ),
+            "/books?offset=": lambda: (
+                f"/books?offset={random.randint(0, size)}&limit=20"
+            ),
+        }
+        for name, make_path in endpoints.items():
+            p50, p99 = time_endpoint(client, make_path, n_requests)
+            print(f"{name:<24} p50 {p50:.3f} ms  p99 {p99:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
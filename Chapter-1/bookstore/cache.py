@@ -0,0 +1,37 @@
+import hashlib
+from typing import Callable
+
+
+class ResponseCache:
+    def __init__(self):
+        self._entries: dict[str, tuple[bytes, str]] = {}
+
+    def get_or_build(
+        self, key: str, build: Callable[[], bytes]
+    ) -> tuple[bytes, str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            body = build()
+            etag = f'"{hashlib.sha256(body).hexdigest()}"'
+            entry = (body, etag)
+            self._entries[key] = entry
+        return entry
+
+    def invalidate(self, key: str | None = None):
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison (RFC 9110 13.1.2)
+    candidates = (
+        tag.strip().removeprefix("W/")
+        for tag in if_none_match.split(",")
+    )
+    return etag in candidates
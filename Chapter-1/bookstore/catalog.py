@@ -0,0 +1,87 @@
+from bisect import bisect_right
+from typing import Iterable
+from model import Book, BookWithID
+
+
+class BookCatalog:
+    def __init__(self):
+        self._books: dict[int, BookWithID] = {}
+        self._ids: list[int] = []
+        self._by_year: dict[int, list[int]] = {}
+        self._by_author: dict[int, list[int]] = {}
+        self._authors: dict[int, str] = {}
+        self._author_ids: dict[str, int] = {}
+        self._next_id = 1
+
+    def __len__(self) -> int:
+        return len(self._books)
+
+    def _author_id(self, name: str) -> int:
+        author_id = self._author_ids.get(name)
+        if author_id is None:
+            author_id = len(self._authors) + 1
+            self._authors[author_id] = name
+            self._author_ids[name] = author_id
+        return author_id
+
+    def add(self, book: Book) -> BookWithID:
+        # ids only ever grow, so every index list stays sorted on append
+        book_id = self._next_id
+        self._next_id += 1
+        author_id = self._author_id(book.author)
+        stored = BookWithID(
+            id=book_id, author_id=author_id, **book.model_dump()
+        )
+        self._books[book_id] = stored
+        self._ids.append(book_id)
+        self._by_year.setdefault(book.year, []).append(book_id)
+        self._by_author.setdefault(author_id, []).append(book_id)
+        return stored
+
+    def extend(self, books: Iterable[Book]):
+        for book in books:
+            self.add(book)
+
+    def clear(self):
+        self.__init__()
+
+    def get(self, book_id: int) -> BookWithID | None:
+        return self._books.get(book_id)
+
+    def get_author(self, author_id: int) -> str | None:
+        return self._authors.get(author_id)
+
+    def all(self) -> list[BookWithID]:
+        return list(self._books.values())
+
+    def list_books(
+        self,
+        year: int | None = None,
+        limit: int = 100,
+        offset: int = 0,
+        after_id: int | None = None,
+    ) -> list[BookWithID]:
+        ids = self._ids if year is None else self._by_year.get(year, [])
+        return self._page(ids, limit, offset, after_id)
+
+    def list_by_author(
+        self,
+        author_id: int,
+        limit: int = 100,
+        offset: int = 0,
+        after_id: int | None = None,
+    ) -> list[BookWithID]:
+        ids = self._by_author.get(author_id, [])
+        return self._page(ids, limit, offset, after_id)
+
+    def _page(
+        self,
+        ids: list[int],
+        limit: int,
+        offset: int,
+        after_id: int | None,
+    ) -> list[BookWithID]:
+        start = offset
+        if after_id is not None:
+            start = bisect_right(ids, after_id)
+        return [self._books[book_id] for book_id in ids[start:start + limit]]
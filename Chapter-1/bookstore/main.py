@@ -1,61 +1,200 @@
 import json
-from fastapi import FastAPI, HTTPException, Request, status
-from pydantic import BaseModel, Field
-from model import Book
+from fastapi import FastAPI, HTTPException, Query, Request, Response, status
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+from model import Book, BookWithID
+from catalog import BookCatalog
+from cache import ResponseCache, etag_matches
 from starlette.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import PlainTextResponse
 
 app = FastAPI()
+
+catalog = BookCatalog()
+catalog.extend([
+    Book(title="1984", author="George Orwell", year=1949),
+    Book(
+        title="The Great Gatsby",
+        author="F. Scott Fitzgerald",
+        year=1925,
+    ),
+])
+
+response_cache = ResponseCache()
+
+def next_after_id(page: list[BookWithID], limit: int) -> int | None:
+    if len(page) < limit:
+        return None
+    return page[-1].id
+
 @app.get("/books/{book_id}")
+def read_book(book_id: int) -> BookWithID:
+    book = catalog.get(book_id)
+    if book is None:
+        raise HTTPException(status_code=404, detail="Book not found")
+    return book
 
-def read_book(book_id: int):
-    return {"book_id": book_id,
-            "title": "The Great Gatsby", 
-            "author": "F. Scott Fitzgerald"
-            }
-    
 @app.get("/authors/{author_id}")
-def read_author(author_id: int):
+def read_author(
+    author_id: int,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    after_id: int | None = None,
+):
+    name = catalog.get_author(author_id)
+    if name is None:
+        raise HTTPException(status_code=404, detail="Author not found")
+    author_books = catalog.list_by_author(
+        author_id, limit=limit, offset=offset, after_id=after_id
+    )
     return {"author_id": author_id,
-            "name": "Ernest Hemingway", 
+            "name": name,
+            "book": author_books,
+            "next_after_id": next_after_id(author_books, limit),
             }
-    
+
 @app.get("/books")
-async def read_books(year: int = None):
+async def read_books(
+    year: int = None,
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    after_id: int | None = None,
+):
+    page = catalog.list_books(
+        year=year, limit=limit, offset=offset, after_id=after_id
+    )
     if year:
-        return { "year": year, 
-                 "book": ["Book 1", "Book 2"] 
+        return { "year": year,
+                 "book": page,
+                 "next_after_id": next_after_id(page, limit),
                 }
-    return {"book": ["All books"]}
-
-@app.post("/books")
-async def create_book(book: Book):
-    return book
+    return {"book": page, "next_after_id": next_after_id(page, limit)}
 
-class Book(BaseModel):
+# Both POST /books and /books/bulk validate against this model, so a book
+# rejected by one is rejected by the other
+class BookCreate(Book):
     title: str = Field(..., min_length=1, max_length=100)
     author: str = Field(..., min_length=1, max_length=50)
     year: int = Field(..., gt=1900, lt=2100)
-    
+
+@app.post("/books")
+async def create_book(book: BookCreate):
+    stored = catalog.add(book)
+    response_cache.invalidate("allbooks")
+    return stored
+
+MAX_REPORTED_ERRORS = 1000
+MAX_NDJSON_LINE_BYTES = 64 * 1024
+
+async def iter_ndjson_lines(request: Request):
+    # Yields None in place of a line longer than MAX_NDJSON_LINE_BYTES;
+    # the rest of such a line is skipped as it arrives, not buffered
+    pending: list[bytes] = []
+    pending_size = 0
+    too_long = False
+    async for chunk in request.stream():
+        *lines, tail = chunk.split(b"\n")
+        for line in lines:
+            if too_long or pending_size + len(line) > MAX_NDJSON_LINE_BYTES:
+                yield None
+            else:
+                pending.append(line)
+                yield b"".join(pending)
+            pending.clear()
+            pending_size = 0
+            too_long = False
+        if not too_long:
+            pending.append(tail)
+            pending_size += len(tail)
+            if pending_size > MAX_NDJSON_LINE_BYTES:
+                pending.clear()
+                too_long = True
+    if too_long:
+        yield None
+    elif pending:
+        yield b"".join(pending)
+
+@app.post(
+    "/books/bulk",
+    openapi_extra={
+        "requestBody": {
+            "content": {
+                "application/x-ndjson": {
+                    "schema": {"type": "string"}
+                }
+            },
+            "required": True,
+        }
+    },
+)
+async def create_books_bulk(request: Request):
+    inserted = 0
+    error_count = 0
+    errors = []
+    line_number = 0
+    async for line in iter_ndjson_lines(request):
+        line_number += 1
+        if line is None:
+            error_count += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({
+                    "type": "too_long",
+                    "loc": ("body", line_number),
+                    "msg": f"Line is longer than {MAX_NDJSON_LINE_BYTES} bytes",
+                    "input": None,
+                })
+            continue
+        if not line.strip():
+            continue
+        try:
+            book = BookCreate.model_validate_json(line)
+        except ValidationError as exc:
+            error_count += 1
+            for error in exc.errors(include_url=False):
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    error["loc"] = ("body", line_number, *error["loc"])
+                    errors.append(error)
+            continue
+        catalog.add(book)
+        inserted += 1
+    if inserted:
+        response_cache.invalidate("allbooks")
+    return JSONResponse(
+        content=jsonable_encoder({
+            "inserted": inserted,
+            "failed": error_count,
+            "errors": errors,
+        })
+    )
+
 class BookResponse(BaseModel):
     title: str
     author: str
     
+all_books_adapter = TypeAdapter(list[BookResponse])
+
+def serialize_all_books() -> bytes:
+    return all_books_adapter.dump_json(
+        [BookResponse(title=b.title, author=b.author) for b in catalog.all()]
+    )
+
 @app.get("/allbooks")
-async def get_all_books() -> list[BookResponse]:
-    return [
-        {
-            "id": 1,
-            "title": "1984",
-            "author": "George Orwell"
-        },
-        {
-            "id": 1,
-            "title": "The Great Gatsby",
-            "author": "F. Scott Fitzgerald"
-        }
-    ]
+async def get_all_books(request: Request) -> list[BookResponse]:
+    body, etag = response_cache.get_or_build(
+        "allbooks", serialize_all_books
+    )
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers=headers,
+        )
+    return Response(
+        content=body,
+        media_type="application/json",
+        headers=headers,
+    )
     
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
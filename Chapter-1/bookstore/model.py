@@ -4,4 +4,7 @@ class Book(BaseModel):
     title: str
     author: str
     year: int
-    
\ No newline at end of file
+
+class BookWithID(Book):
+    id: int
+    author_id: int
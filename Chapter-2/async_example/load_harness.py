@@ -0,0 +1,325 @@
+import argparse
+import asyncio
+import importlib.util
+import itertools
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from collections.abc import Awaitable, Callable
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+
+from httpx import AsyncClient, Limits, Response
+
+HISTOGRAM_BUCKETS_MS = [
+    1, 2, 5, 10, 20, 50, 100, 200, 500,
+    1000, 2000, 5000, 10000, 20000, 60000,
+]
+
+LOOP_PACKAGES = {"asyncio": None, "uvloop": "uvloop"}
+HTTP_PACKAGES = {"h11": "h11", "httptools": "httptools"}
+
+
+@dataclass(frozen=True)
+class ServerOptions:
+    workers: int = 1
+    loop: str = "asyncio"
+    http: str = "h11"
+
+    def missing_package(self) -> str | None:
+        for package in (
+            LOOP_PACKAGES[self.loop], HTTP_PACKAGES[self.http]
+        ):
+            if package and importlib.util.find_spec(package) is None:
+                return package
+        return None
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_ready(
+    base_url: str, path: str = "/openapi.json", timeout: float = 30
+):
+    deadline = time.monotonic() + timeout
+    async with AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                response = await client.get(path, timeout=1)
+                if response.status_code < 500:
+                    return
+            except Exception:
+                pass
+            await asyncio.sleep(0.05)
+    raise TimeoutError(f"server at {base_url} not ready after {timeout}s")
+
+
+@contextmanager
+def run_server(
+    app: str, options: ServerOptions, port: int, env: dict | None = None
+):
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", app,
+            "--port", str(port),
+            "--workers", str(options.workers),
+            "--loop", options.loop,
+            "--http", options.http,
+            "--log-level", "error",
+        ],
+        env={**os.environ, **(env or {})},
+    )
+    try:
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def percentile(sorted_samples: list[float], q: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    rank = max(math.ceil(q / 100 * len(sorted_samples)) - 1, 0)
+    return sorted_samples[rank]
+
+
+def histogram(samples_ms: list[float]) -> dict[str, int]:
+    counts = {f"<={bound}": 0 for bound in HISTOGRAM_BUCKETS_MS}
+    counts["+inf"] = 0
+    for sample in samples_ms:
+        for bound in HISTOGRAM_BUCKETS_MS:
+            if sample <= bound:
+                counts[f"<={bound}"] += 1
+                break
+        else:
+            counts["+inf"] += 1
+    return counts
+
+
+def summarize(latencies: list[float]) -> dict:
+    samples_ms = sorted(latency * 1000 for latency in latencies)
+    return {
+        "latency_ms": {
+            "p50": percentile(samples_ms, 50),
+            "p90": percentile(samples_ms, 90),
+            "p99": percentile(samples_ms, 99),
+            "max": samples_ms[-1] if samples_ms else 0.0,
+        },
+        "histogram_ms": histogram(samples_ms),
+    }
+
+
+async def run_load(
+    base_url: str,
+    path: str,
+    concurrency: int,
+    n_requests: int,
+    send: Callable[[AsyncClient, int], Awaitable[Response]] | None = None,
+) -> dict:
+    # send(client, n) makes request number n; by default every request
+    # is a GET of path
+    latencies: list[float] = []
+    errors = 0
+    remaining = iter(range(n_requests))
+
+    async def worker(client: AsyncClient):
+        nonlocal errors
+        for n in remaining:
+            begin = time.perf_counter()
+            try:
+                if send is None:
+                    response = await client.get(path)
+                else:
+                    response = await send(client, n)
+                failed = response.status_code >= 400
+            except Exception:
+                failed = True
+            latencies.append(time.perf_counter() - begin)
+            errors += failed
+
+    limits = Limits(
+        max_connections=concurrency,
+        max_keepalive_connections=concurrency,
+    )
+    async with AsyncClient(
+        base_url=base_url, limits=limits, timeout=None
+    ) as client:
+        begin = time.perf_counter()
+        await asyncio.gather(
+            *(worker(client) for _ in range(concurrency))
+        )
+        elapsed = time.perf_counter() - begin
+
+    return {
+        "path": path,
+        "concurrency": concurrency,
+        "requests": n_requests,
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "rps": n_requests / elapsed if elapsed else 0.0,
+        **summarize(latencies),
+    }
+
+
+async def run_matrix(
+    app: str,
+    paths: list[str],
+    concurrency_levels: list[int],
+    requests_per_level: int,
+    server_matrix: list[ServerOptions],
+) -> dict:
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "app": app,
+        "results": [],
+        "skipped": [],
+    }
+    for options in server_matrix:
+        missing = options.missing_package()
+        if missing:
+            report["skipped"].append(
+                {"server": asdict(options), "reason": f"{missing} not installed"}
+            )
+            continue
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        with run_server(app, options, port):
+            await wait_until_ready(base_url)
+            for path, concurrency in itertools.product(
+                paths, concurrency_levels
+            ):
+                n_requests = max(requests_per_level, concurrency)
+                result = await run_load(
+                    base_url, path, concurrency, n_requests
+                )
+                result["server"] = asdict(options)
+                report["results"].append(result)
+                print(
+                    f"{options} {path} c={concurrency}: "
+                    f"{result['rps']:.1f} req/s, "
+                    f"p50 {result['latency_ms']['p50']:.1f} ms, "
+                    f"p99 {result['latency_ms']['p99']:.1f} ms"
+                )
+    return report
+
+
+def result_key(result: dict) -> tuple:
+    server = result["server"]
+    return (
+        server["workers"], server["loop"], server["http"],
+        result["path"], result["concurrency"],
+    )
+
+
+def compare_reports(
+    baseline: dict, current: dict, tolerance: float = 0.10
+) -> list[str]:
+    baseline_results = {
+        result_key(result): result for result in baseline["results"]
+    }
+    regressions = []
+    for result in current["results"]:
+        previous = baseline_results.get(result_key(result))
+        if previous is None:
+            continue
+        p99_before = previous["latency_ms"]["p99"]
+        p99_after = result["latency_ms"]["p99"]
+        if p99_after > p99_before * (1 + tolerance):
+            regressions.append(
+                f"{result_key(result)} p99 "
+                f"{p99_before:.1f} -> {p99_after:.1f} ms"
+            )
+        if result["rps"] < previous["rps"] * (1 - tolerance):
+            regressions.append(
+                f"{result_key(result)} rps "
+                f"{previous['rps']:.1f} -> {result['rps']:.1f}"
+            )
+        if result["errors"] > previous["errors"]:
+            regressions.append(
+                f"{result_key(result)} errors "
+                f"{previous['errors']} -> {result['errors']}"
+            )
+    return regressions
+
+
+def int_list(value: str) -> list[int]:
+    return [int(item) for item in value.split(",")]
+
+
+def str_list(value: str) -> list[str]:
+    return value.split(",")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Concurrency sweep and latency report for an ASGI app"
+    )
+    parser.add_argument("--app", default="main:app")
+    parser.add_argument("--paths", type=str_list, default=["/sync", "/async"])
+    parser.add_argument(
+        "--concurrency", type=int_list, default=[1, 10, 50, 100]
+    )
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--workers", type=int_list, default=[1])
+    parser.add_argument(
+        "--loops", type=str_list, default=["asyncio", "uvloop"]
+    )
+    parser.add_argument(
+        "--http", type=str_list, default=["h11", "httptools"]
+    )
+    parser.add_argument("--output", default="load_report.json")
+    parser.add_argument(
+        "--compare", help="baseline report to check for regressions"
+    )
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    server_matrix = [
+        ServerOptions(workers=workers, loop=loop, http=http)
+        for workers, loop, http in itertools.product(
+            args.workers, args.loops, args.http
+        )
+    ]
+    report = asyncio.run(
+        run_matrix(
+            args.app,
+            args.paths,
+            args.concurrency,
+            args.requests,
+            server_matrix,
+        )
+    )
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare_reports(baseline, report, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
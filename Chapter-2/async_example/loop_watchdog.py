@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+LOOP_WATCHDOG = os.getenv("LOOP_WATCHDOG", "0") == "1"
+LOOP_WATCHDOG_THRESHOLD_MS = float(
+    os.getenv("LOOP_WATCHDOG_THRESHOLD_MS", "100")
+)
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def _running_task(loop: asyncio.AbstractEventLoop):
+    # Read from the watchdog thread while the loop is stuck, so the
+    # loop cannot be asked directly
+    current_tasks = getattr(asyncio.tasks, "_current_tasks", None)
+    if current_tasks is None:
+        return None
+    return current_tasks.get(loop)
+
+
+class LoopWatchdog:
+    def __init__(
+        self,
+        threshold: float = LOOP_WATCHDOG_THRESHOLD_MS / 1000,
+        interval: float | None = None,
+        max_incidents: int = 100,
+    ):
+        self.threshold = threshold
+        self.interval = interval or threshold / 4
+        self.incidents: deque[dict] = deque(maxlen=max_incidents)
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self.requests: dict[asyncio.Task, dict] = {}
+        # When the heartbeat's sleep should end; time past it is time the
+        # loop spent blocked, not the heartbeat's own sleep
+        self._expected_wake = time.perf_counter() + self.interval
+        self._open_incident: dict | None = None
+        self._beat_task: asyncio.Task | None = None
+        self._thread: threading.Thread | None = None
+        self._stopped = threading.Event()
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._expected_wake = time.perf_counter() + self.interval
+        self._stopped.clear()
+        self._beat_task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._beat_task:
+            self._beat_task.cancel()
+        if self._thread:
+            self._thread.join()
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.perf_counter() + self.interval
+            self._expected_wake = expected
+            await asyncio.sleep(self.interval)
+            self.last_lag = max(time.perf_counter() - expected, 0.0)
+            self.max_lag = max(self.max_lag, self.last_lag)
+            if self._open_incident is not None:
+                # Replace the time seen at detection with the full stall
+                self._open_incident["blocked_ms"] = self.last_lag * 1000
+                self._open_incident = None
+
+    def _watch(self):
+        reported_wake = None
+        while not self._stopped.wait(self.interval):
+            wake = self._expected_wake
+            blocked_for = time.perf_counter() - wake
+            if blocked_for < self.threshold or wake == reported_wake:
+                continue
+            reported_wake = wake
+            self._report(blocked_for)
+
+    def _report(self, blocked_for: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = traceback.format_stack(frame) if frame else []
+        task = _running_task(self._loop)
+        scope = self.requests.get(task, {})
+        route = scope.get("route")
+        incident = {
+            "blocked_ms": blocked_for * 1000,
+            "method": scope.get("method"),
+            "path": scope.get("path"),
+            "route": getattr(route, "path", None),
+            "task": task.get_name() if task else None,
+            "stack": stack,
+        }
+        self.incidents.append(incident)
+        self._open_incident = incident
+        logger.warning(
+            f"Event loop blocked for {incident['blocked_ms']:.0f} ms "
+            f"in {incident['method']} {incident['route'] or incident['path']}"
+            f"\n{''.join(stack)}"
+        )
+
+    def snapshot(self) -> dict:
+        return {
+            "threshold_ms": self.threshold * 1000,
+            "last_lag_ms": self.last_lag * 1000,
+            "max_lag_ms": self.max_lag * 1000,
+            "incidents": list(self.incidents),
+        }
+
+
+class LoopWatchdogMiddleware:
+    def __init__(self, app, watchdog: LoopWatchdog):
+        self.app = app
+        self.watchdog = watchdog
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        # The router stores the matched route in this same scope dict,
+        # so the watchdog can name the route once it has been resolved
+        task = asyncio.current_task()
+        self.watchdog.requests[task] = scope
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.watchdog.requests.pop(task, None)
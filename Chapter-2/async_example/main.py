@@ -1,9 +1,35 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 import time, asyncio
 
-app = FastAPI()
+from loop_watchdog import (
+    LOOP_WATCHDOG,
+    LoopWatchdog,
+    LoopWatchdogMiddleware,
+)
+from threadpool import (
+    configure_threadpool,
+    metrics,
+    run_in_metered_threadpool,
+)
+
+watchdog = LoopWatchdog()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_threadpool()
+    if LOOP_WATCHDOG:
+        await watchdog.start()
+    yield
+    if LOOP_WATCHDOG:
+        await watchdog.stop()
+
+app = FastAPI(lifespan=lifespan)
+if LOOP_WATCHDOG:
+    app.add_middleware(LoopWatchdogMiddleware, watchdog=watchdog)
 
 @app.get("/sync")
+@run_in_metered_threadpool
 def read_sync():
     time.sleep(2)
     return {"message": "Synchronous blocking endpoint"}
@@ -11,4 +37,13 @@ def read_sync():
 @app.get("/async")
 async def read_async():
     await asyncio.sleep(5)
-    return {"message": "Asynchronous non-blocking endpoint"}
\ No newline at end of file
+    return {"message": "Asynchronous non-blocking endpoint"}
+
+@app.get("/metrics/threadpool")
+async def read_threadpool_metrics():
+    return metrics.snapshot()
+
+
+@app.get("/metrics/event-loop")
+async def read_event_loop_metrics():
+    return watchdog.snapshot()
@@ -0,0 +1,108 @@
+import functools
+import os
+import statistics
+import time
+from collections import deque
+
+import anyio.to_thread
+from fastapi import HTTPException, status
+
+THREADPOOL_CAPACITY = int(os.getenv("THREADPOOL_CAPACITY", "40"))
+# Above this many handlers queued for a thread, new work is rejected
+# with 503 instead of waiting. Unset means the queue is unbounded.
+THREADPOOL_MAX_WAITING = (
+    int(os.getenv("THREADPOOL_MAX_WAITING"))
+    if os.getenv("THREADPOOL_MAX_WAITING")
+    else None
+)
+
+
+class ThreadpoolMetrics:
+    def __init__(self, window: int = 1024):
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.max_wait = 0.0
+        self.total_wait = 0.0
+        self.recent_waits: deque[float] = deque(maxlen=window)
+
+    def record_wait(self, wait: float):
+        self.completed += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.recent_waits.append(wait)
+
+    def snapshot(self) -> dict:
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        stats = limiter.statistics()
+        waits = sorted(self.recent_waits)
+        return {
+            "capacity": stats.total_tokens,
+            "threads_in_use": stats.borrowed_tokens,
+            "tasks_waiting": stats.tasks_waiting,
+            "max_waiting": THREADPOOL_MAX_WAITING,
+            "metered_in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "queue_wait_ms": {
+                "mean": (
+                    self.total_wait / self.completed * 1000
+                    if self.completed else 0.0
+                ),
+                "p50": (
+                    statistics.median(waits) * 1000 if waits else 0.0
+                ),
+                "p99": (
+                    waits[int((len(waits) - 1) * 0.99)] * 1000
+                    if waits else 0.0
+                ),
+                "max": self.max_wait * 1000,
+            },
+        }
+
+
+metrics = ThreadpoolMetrics()
+
+
+def configure_threadpool(capacity: int = THREADPOOL_CAPACITY):
+    # The default limiter lives per event loop, so this has to run
+    # inside it (e.g. from the app lifespan)
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter.total_tokens = capacity
+
+
+def run_in_metered_threadpool(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        # The limiter's own statistics lag behind while acquisitions are
+        # in flight, so admission counts handlers we have dispatched
+        if (
+            THREADPOOL_MAX_WAITING is not None
+            and metrics.in_flight
+            >= limiter.total_tokens + THREADPOOL_MAX_WAITING
+        ):
+            metrics.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Threadpool saturated",
+                headers={"Retry-After": "1"},
+            )
+
+        queued_at = time.perf_counter()
+        started_at = None
+
+        def run():
+            nonlocal started_at
+            started_at = time.perf_counter()
+            return func(*args, **kwargs)
+
+        metrics.in_flight += 1
+        try:
+            return await anyio.to_thread.run_sync(run)
+        finally:
+            metrics.in_flight -= 1
+            if started_at is not None:
+                metrics.record_wait(started_at - queued_at)
+
+    return wrapper
@@ -1,44 +1,29 @@
-from main import app
-from multiprocessing import Process
-from contextlib import contextmanager
-import time, asyncio, uvicorn
-from httpx import AsyncClient
+import asyncio
+
+from load_harness import (
+    ServerOptions,
+    free_port,
+    run_load,
+    run_server,
+    wait_until_ready,
+)
 
-def run_server():
-    uvicorn.run(app, port=8000, log_level="error")
-    
-@contextmanager
-def run_server_in_process():
-    p = Process(target=run_server)
-    p.start()
-    time.sleep(2)
-    print("Server is running in a separate process")
-    
-    yield
-    p.terminate()
 
-async def make_requests_to_the_endpoint(n: int, path: str):
-    async with AsyncClient(base_url="http://localhost:8000") as client:
-        task = (client.get(path, timeout = float("inf"))for _ in range(n))
-        
-        await asyncio.gather(*task)
-        
 async def main(n: int = 10):
-    with run_server_in_process():
-        begin = time.time()
-        await make_requests_to_the_endpoint(n, "/sync")
-        
-        end = time.time()
-        print(f"Time taken to make {n} requests"
-              f" to sync endpoint: {end - begin} seconds")
-        
-        begin = time.time()
-        await make_requests_to_the_endpoint(n, "/async")
-        
-        end = time.time()
-        print(f"Time taken to make {n} requests"
-              f" to async endpoint: {end - begin} seconds")
-        
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    with run_server("main:app", ServerOptions(), port):
+        await wait_until_ready(base_url)
+        print("Server is running in a separate process")
+
+        for path in ("/sync", "/async"):
+            result = await run_load(base_url, path, n, n)
+            latency = result["latency_ms"]
+            print(f"Time taken to make {n} requests"
+                  f" to {path} endpoint: {result['elapsed_s']:.2f} seconds"
+                  f" ({result['rps']:.1f} req/s, p50 {latency['p50']:.0f} ms,"
+                  f" p99 {latency['p99']:.0f} ms)")
+
+
 if __name__ == "__main__":
     asyncio.run(main(n=100))
-    
\ No newline at end of file
@@ -0,0 +1,127 @@
+import asyncio
+import random
+import sys
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from bson import ObjectId
+from fastapi import FastAPI, HTTPException
+from httpx import AsyncClient
+from pymongo import MongoClient
+
+import database
+from database import MONGO_MAX_POOL_SIZE, MONGO_URL
+from main import User, UserResponse
+
+# Servers, the request loop and percentiles come from the load harness
+sys.path.append(str(Path(__file__).resolve().parents[1] / "async_example"))
+from load_harness import (  # noqa: E402
+    ServerOptions,
+    free_port,
+    run_load,
+    run_server,
+    wait_until_ready,
+)
+
+N_CLIENTS = 500
+N_REQUESTS = 20_000
+
+
+class SyncConnection:
+    collection = None
+
+
+sync = SyncConnection()
+
+
+@asynccontextmanager
+async def sync_lifespan(app: FastAPI):
+    client = MongoClient(MONGO_URL, maxPoolSize=MONGO_MAX_POOL_SIZE)
+    sync.collection = client[database.MONGO_DATABASE]["users"]
+    yield
+    client.close()
+
+
+# The previous blocking implementation, kept here as the baseline
+sync_app = FastAPI(lifespan=sync_lifespan)
+
+
+@sync_app.get("/users")
+def read_users() -> list[User]:
+    return [user for user in sync.collection.find()]
+
+
+@sync_app.post("/user")
+def create_user(user: User) -> UserResponse:
+    result = sync.collection.insert_one(user.model_dump(exclude_none=True))
+    return UserResponse(id=str(result.inserted_id), **user.model_dump())
+
+
+@sync_app.get("/user")
+def get_user(user_id: str) -> UserResponse:
+    db_user = sync.collection.find_one(
+        {"_id": ObjectId(user_id) if ObjectId.is_valid(user_id) else None}
+    )
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    db_user["id"] = str(db_user["_id"])
+    return db_user
+
+
+def new_user(n: int) -> dict:
+    email = f"user{n}-{uuid.uuid4().hex}@example.com"
+    return {"name": f"user{n}", "email": email, "age": 30}
+
+
+async def seed_user(client: AsyncClient, n: int) -> str:
+    response = await client.post("/user", json=new_user(n))
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+async def benchmark(name: str, app: str):
+    # Each run gets its own database: the sync app has no unique email
+    # index, and the async app's lifespan would refuse to start on the
+    # duplicates a shared database could end up with
+    database_name = f"benchmark_{name}_{uuid.uuid4().hex[:8]}"
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        with run_server(
+            app, ServerOptions(), port, env={"MONGO_DATABASE": database_name}
+        ):
+            await wait_until_ready(base_url)
+            async with AsyncClient(base_url=base_url) as client:
+                seeded = [await seed_user(client, n) for n in range(100)]
+
+            def send(client: AsyncClient, n: int):
+                # 80% reads, 20% writes
+                if n % 5:
+                    return client.get(
+                        "/user", params={"user_id": random.choice(seeded)}
+                    )
+                return client.post("/user", json=new_user(n))
+
+            result = await run_load(
+                base_url, "/user", N_CLIENTS, N_REQUESTS, send
+            )
+    finally:
+        with MongoClient(MONGO_URL) as mongo_client:
+            mongo_client.drop_database(database_name)
+    latency = result["latency_ms"]
+    print(
+        f"{name:<6} {result['rps']:8.1f} req/s  "
+        f"p50 {latency['p50']:7.1f} ms  p99 {latency['p99']:7.1f} ms  "
+        f"errors {result['errors']}"
+    )
+
+
+async def main():
+    print(f"{N_REQUESTS} requests from {N_CLIENTS} concurrent clients")
+    await benchmark("sync", "benchmark_motor:sync_app")
+    await benchmark("async", "main:app")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
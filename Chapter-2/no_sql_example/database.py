@@ -1,7 +1,116 @@
-from pymongo import MongoClient
+import logging
+import os
+from contextlib import asynccontextmanager
 
-client = MongoClient()
+from fastapi import FastAPI
+from motor.motor_asyncio import (
+    AsyncIOMotorClient,
+    AsyncIOMotorCollection,
+)
 
-database = client.mydatabase
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+MONGO_DATABASE = os.getenv("MONGO_DATABASE", "mydatabase")
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "10"))
+MONGO_CONNECT_TIMEOUT_MS = int(
+    os.getenv("MONGO_CONNECT_TIMEOUT_MS", "2000")
+)
+MONGO_SOCKET_TIMEOUT_MS = int(
+    os.getenv("MONGO_SOCKET_TIMEOUT_MS", "10000")
+)
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(
+    os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")
+)
+# How long a request may wait for a free pooled connection
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(
+    os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000")
+)
 
-user_collection = database["users"]
\ No newline at end of file
+logger = logging.getLogger("uvicorn.error")
+
+
+class MongoConnection:
+    client: AsyncIOMotorClient | None = None
+
+
+mongo = MongoConnection()
+
+
+def create_client() -> AsyncIOMotorClient:
+    return AsyncIOMotorClient(
+        MONGO_URL,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        # Datetimes come back as UTC-aware, the same as they are written,
+        # so created_at serializes with its offset on reads too
+        tz_aware=True,
+    )
+
+
+def get_database():
+    return mongo.client[MONGO_DATABASE]
+
+
+def get_user_collection() -> AsyncIOMotorCollection:
+    return get_database()["users"]
+
+
+def get_tweet_collection() -> AsyncIOMotorCollection:
+    return get_database()["tweets"]
+
+
+async def check_unique_emails():
+    # The unique index treats a missing email as null, so documents
+    # without one collide with each other as well; both kinds are
+    # reported before create_index would stop on the first E11000
+    duplicates = await get_user_collection().aggregate([
+        {"$group": {"_id": "$email", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$limit": 5},
+    ]).to_list(None)
+    if duplicates:
+        listed = ", ".join(
+            f"<no email> x{duplicate['count']}" if duplicate["_id"] is None
+            else f"{duplicate['_id']!r} x{duplicate['count']}"
+            for duplicate in duplicates
+        )
+        raise RuntimeError(
+            f"Cannot build the unique email index on "
+            f"{MONGO_DATABASE}.users, some documents share an email: "
+            f"{listed}. Give each user document its own email (or remove "
+            f"the extra ones) and restart; the index is built on startup."
+        )
+
+
+async def create_indexes():
+    users = get_user_collection()
+    if "email_1" not in await users.index_information():
+        await check_unique_emails()
+    await users.create_index("email", unique=True)
+    tweets = get_tweet_collection()
+    await tweets.create_index([("user_id", 1), ("_id", -1)])
+    # Multikey: one entry per hashtag of every tweet in the bucket
+    await tweets.create_index(
+        [("tweets.hashtags", 1), ("last_tweet_at", -1)]
+    )
+    await tweets.create_index([("last_tweet_at", -1)])
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    mongo.client = create_client()
+    try:
+        await mongo.client.admin.command("ping")
+        logger.info("Connected to MongoDB")
+    except Exception as e:
+        logger.error(f"Error connecting to MongoDB: {e}")
+        mongo.client.close()
+        raise e
+    await create_indexes()
+    yield
+    mongo.client.close()
+    mongo.client = None
@@ -1,14 +1,15 @@
-from database import user_collection
-from fastapi import  FastAPI, HTTPException
+from database import get_tweet_collection, get_user_collection, lifespan
+from typing import Literal
+from fastapi import  FastAPI, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, EmailStr, field_validator
 from bson import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from tweets import Tweet, new_buckets, router as tweets_router
 
 
-app = FastAPI()
-
-class Tweet(BaseModel):
-    content: str
-    hashtags: list[str]
+app = FastAPI(lifespan=lifespan)
+app.include_router(tweets_router)
 
 class User(BaseModel):
     name: str
@@ -23,31 +24,135 @@ class User(BaseModel):
         return value
     
     
-@app.get("/users")
-def read_users() -> list[User]:
-    return [user for user in user_collection.find()]
-    
 class UserResponse(User):
     id: str
 
-@app.post("/user")
-def create_user(user: User) -> UserResponse:
-    result = user_collection.insert_one(
-        user.model_dump(exclude_none=True)
+# Tweets are stored in the tweets collection; this also hides any legacy
+# embedded tweets from profile reads
+USER_PROJECTION = {"tweets": 0}
+
+def user_document(user: User) -> dict:
+    return user.model_dump(exclude_none=True, exclude={"tweets"})
+
+async def store_initial_tweets(pairs: list[tuple[ObjectId, User]]):
+    buckets = [
+        bucket
+        for user_id, user in pairs
+        if user.tweets
+        for bucket in new_buckets(user_id, user.tweets)
+    ]
+    if buckets:
+        await get_tweet_collection().insert_many(buckets)
+
+def to_user_response(db_user: dict) -> UserResponse:
+    db_user["id"] = str(db_user.pop("_id"))
+    return UserResponse.model_validate(db_user)
+
+async def stream_users(cursor):
+    async for db_user in cursor:
+        yield to_user_response(db_user).model_dump_json() + "\n"
+
+@app.get("/users")
+async def read_users(
+    after_id: str | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+    batch_size: int = Query(100, ge=1, le=10000),
+    format: Literal["json", "ndjson"] = "json",
+) -> list[UserResponse]:
+    query = {}
+    if after_id is not None:
+        if not ObjectId.is_valid(after_id):
+            raise HTTPException(
+                status_code=400,
+                detail="Invalid after_id"
+            )
+        query["_id"] = {"$gt": ObjectId(after_id)}
+    cursor = (
+        get_user_collection()
+        .find(query, USER_PROJECTION)
+        .sort("_id", 1)
+        .batch_size(batch_size)
     )
+    if format == "ndjson":
+        # Streams the whole remaining collection, one batch in memory
+        return StreamingResponse(
+            stream_users(cursor),
+            media_type="application/x-ndjson",
+        )
+    return [
+        to_user_response(db_user)
+        async for db_user in cursor.limit(limit)
+    ]
+
+@app.post("/user")
+async def create_user(user: User) -> UserResponse:
+    try:
+        result = await get_user_collection().insert_one(
+            user_document(user)
+        )
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=409,
+            detail="Email already registered"
+        )
+    await store_initial_tweets([(result.inserted_id, user)])
     user_response = UserResponse(
         id=str(result.inserted_id), **user.model_dump()
     )
     return user_response
 
+BULK_INSERT_BATCH_SIZE = 1000
+
+class BulkInsertError(BaseModel):
+    index: int
+    code: int
+    message: str
+
+class BulkInsertResponse(BaseModel):
+    inserted_ids: list[str]
+    errors: list[BulkInsertError]
+
+@app.post("/users/bulk")
+async def create_users_bulk(users: list[User]) -> BulkInsertResponse:
+    inserted_ids = []
+    errors = []
+    for start in range(0, len(users), BULK_INSERT_BATCH_SIZE):
+        batch = users[start:start + BULK_INSERT_BATCH_SIZE]
+        documents = [user_document(user) for user in batch]
+        failed = set()
+        try:
+            await get_user_collection().insert_many(
+                documents, ordered=False
+            )
+        except BulkWriteError as e:
+            for write_error in e.details["writeErrors"]:
+                failed.add(write_error["index"])
+                errors.append(
+                    BulkInsertError(
+                        index=start + write_error["index"],
+                        code=write_error["code"],
+                        message=write_error["errmsg"],
+                    )
+                )
+        # insert_many sets _id on each document before sending it
+        inserted = [
+            (document["_id"], user)
+            for index, (document, user) in enumerate(zip(documents, batch))
+            if index not in failed
+        ]
+        await store_initial_tweets(inserted)
+        inserted_ids.extend(str(user_id) for user_id, _ in inserted)
+    return BulkInsertResponse(inserted_ids=inserted_ids, errors=errors)
+
 @app.get("/user")
-def get_user(user_id: str) -> UserResponse:
-    db_user = user_collection.find_one(
+async def get_user(user_id: str) -> UserResponse:
+    db_user = await get_user_collection().find_one(
         {
             "_id": ObjectId(user_id)
             if ObjectId.is_valid(user_id)
             else None
-        }
+        },
+        USER_PROJECTION,
     )
     if db_user is None:
         raise HTTPException(
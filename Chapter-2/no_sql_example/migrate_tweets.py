@@ -0,0 +1,31 @@
+import asyncio
+
+from database import (
+    create_client, get_tweet_collection, get_user_collection, mongo
+)
+from tweets import Tweet, new_buckets
+
+
+async def main():
+    mongo.client = create_client()
+    users = get_user_collection()
+    tweets = get_tweet_collection()
+    migrated = 0
+    async for db_user in users.find(
+        {"tweets.0": {"$exists": True}}, {"tweets": 1}
+    ):
+        buckets = new_buckets(
+            db_user["_id"],
+            [Tweet(**tweet) for tweet in db_user["tweets"]],
+        )
+        await tweets.insert_many(buckets)
+        await users.update_one(
+            {"_id": db_user["_id"]}, {"$unset": {"tweets": ""}}
+        )
+        migrated += 1
+    print(f"Moved embedded tweets of {migrated} users into buckets")
+    mongo.client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,164 @@
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel, field_validator
+
+from database import get_tweet_collection, get_user_collection
+
+# Tweets live in per-user bucket documents of at most this many tweets,
+# so user documents stay small however much a user posts
+TWEETS_PER_BUCKET = 50
+
+router = APIRouter(tags=["tweets"])
+
+
+class Tweet(BaseModel):
+    content: str
+    hashtags: list[str]
+
+    @field_validator("hashtags")
+    def normalize_hashtags(cls, value):
+        return [hashtag.lstrip("#").lower() for hashtag in value]
+
+
+class StoredTweet(Tweet):
+    created_at: datetime
+
+
+class TweetPage(BaseModel):
+    tweets: list[StoredTweet]
+    next_before: str | None
+
+
+class HashtagCount(BaseModel):
+    hashtag: str
+    count: int
+
+
+def parse_object_id(value: str, name: str) -> ObjectId:
+    if not ObjectId.is_valid(value):
+        raise HTTPException(status_code=400, detail=f"Invalid {name}")
+    return ObjectId(value)
+
+
+def utc_now() -> datetime:
+    # BSON dates hold milliseconds; truncating here keeps the value a
+    # POST returns equal to what later reads return
+    now = datetime.now(timezone.utc)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+
+def new_buckets(user_id: ObjectId, tweets: list[Tweet]) -> list[dict]:
+    now = utc_now()
+    stored = [{**tweet.model_dump(), "created_at": now} for tweet in tweets]
+    return [
+        {
+            "user_id": user_id,
+            "count": len(chunk),
+            "first_tweet_at": now,
+            "last_tweet_at": now,
+            "tweets": chunk,
+        }
+        for chunk in (
+            stored[start:start + TWEETS_PER_BUCKET]
+            for start in range(0, len(stored), TWEETS_PER_BUCKET)
+        )
+    ]
+
+
+async def add_tweet(user_id: ObjectId, tweet: Tweet) -> StoredTweet:
+    stored = StoredTweet(created_at=utc_now(), **tweet.model_dump())
+    await get_tweet_collection().update_one(
+        {"user_id": user_id, "count": {"$lt": TWEETS_PER_BUCKET}},
+        {
+            "$push": {"tweets": stored.model_dump()},
+            "$inc": {"count": 1},
+            "$min": {"first_tweet_at": stored.created_at},
+            "$max": {"last_tweet_at": stored.created_at},
+        },
+        upsert=True,
+    )
+    return stored
+
+
+@router.post("/user/{user_id}/tweets")
+async def create_tweet(user_id: str, tweet: Tweet) -> StoredTweet:
+    user_object_id = parse_object_id(user_id, "user_id")
+    db_user = await get_user_collection().find_one(
+        {"_id": user_object_id}, {"_id": 1}
+    )
+    if db_user is None:
+        raise HTTPException(
+            status_code=404,
+            detail="User not found"
+        )
+    return await add_tweet(user_object_id, tweet)
+
+
+@router.get("/user/{user_id}/tweets")
+async def read_user_tweets(
+    user_id: str,
+    before: str | None = None,
+    buckets: int = Query(1, ge=1, le=20),
+) -> TweetPage:
+    query = {"user_id": parse_object_id(user_id, "user_id")}
+    if before is not None:
+        query["_id"] = {"$lt": parse_object_id(before, "before")}
+    cursor = (
+        get_tweet_collection()
+        .find(query)
+        .sort("_id", -1)
+        .limit(buckets)
+    )
+    tweets = []
+    bucket_ids = []
+    async for bucket in cursor:
+        tweets.extend(reversed(bucket["tweets"]))
+        bucket_ids.append(str(bucket["_id"]))
+    next_before = bucket_ids[-1] if len(bucket_ids) == buckets else None
+    return TweetPage(tweets=tweets, next_before=next_before)
+
+
+@router.get("/tweets")
+async def read_tweets_by_hashtag(
+    hashtag: str,
+    limit: int = Query(100, ge=1, le=1000),
+) -> list[StoredTweet]:
+    hashtag = hashtag.lstrip("#").lower()
+    pipeline = [
+        {"$match": {"tweets.hashtags": hashtag}},
+        {"$sort": {"last_tweet_at": -1}},
+        {"$unwind": "$tweets"},
+        {"$match": {"tweets.hashtags": hashtag}},
+        {"$limit": limit},
+        {"$replaceRoot": {"newRoot": "$tweets"}},
+    ]
+    return [
+        tweet
+        async for tweet in get_tweet_collection().aggregate(pipeline)
+    ]
+
+
+@router.get("/hashtags/trending")
+async def read_trending_hashtags(
+    hours: int = Query(24, ge=1, le=24 * 30),
+    limit: int = Query(10, ge=1, le=100),
+) -> list[HashtagCount]:
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    pipeline = [
+        {
+            # Only buckets written to inside the window are read
+            "$match": {"last_tweet_at": {"$gte": since}}
+        },
+        {"$unwind": "$tweets"},
+        {"$match": {"tweets.created_at": {"$gte": since}}},
+        {"$unwind": "$tweets.hashtags"},
+        {"$group": {"_id": "$tweets.hashtags", "count": {"$sum": 1}}},
+        {"$sort": {"count": -1, "_id": 1}},
+        {"$limit": limit},
+        {"$project": {"_id": 0, "hashtag": "$_id", "count": 1}},
+    ]
+    return [
+        row async for row in get_tweet_collection().aggregate(pipeline)
+    ]
@@ -0,0 +1,87 @@
+import asyncio
+import random
+import sys
+import tempfile
+from pathlib import Path
+
+from httpx import AsyncClient
+
+# Servers, the request loop and percentiles come from the load harness
+sys.path.append(str(Path(__file__).resolve().parents[1] / "async_example"))
+from load_harness import (  # noqa: E402
+    ServerOptions,
+    free_port,
+    run_load,
+    run_server,
+    wait_until_ready,
+)
+
+N_CLIENTS = 500
+N_REQUESTS = 20_000
+SEED_USERS = 10_000
+
+
+async def seed(client: AsyncClient) -> list[int]:
+    await client.post(
+        "/users/bulk",
+        json=[
+            {"name": f"user{n}", "email": f"user{n}@example.com"}
+            for n in range(SEED_USERS)
+        ],
+    )
+    user_ids = []
+    after_id = None
+    while True:
+        params = {"limit": 1000, "fields": "id"}
+        if after_id is not None:
+            params["after_id"] = after_id
+        page = (await client.get("/users/", params=params)).json()
+        if not page:
+            return user_ids
+        user_ids.extend(row["id"] for row in page)
+        after_id = user_ids[-1]
+
+
+async def benchmark(name: str, app: str, directory: Path):
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    # Each app gets its own database file; database.py reads it on import
+    database_url = f"sqlite:///{directory / f'{name}.db'}"
+    with run_server(
+        app, ServerOptions(), port, env={"DATABASE_URL": database_url}
+    ):
+        await wait_until_ready(base_url)
+        async with AsyncClient(base_url=base_url, timeout=None) as client:
+            user_ids = await seed(client)
+
+        def send(client: AsyncClient, n: int):
+            # 80% single-user reads, 20% page reads
+            if n % 5:
+                return client.get(
+                    "/user", params={"user_id": random.choice(user_ids)}
+                )
+            return client.get(
+                "/users/",
+                params={"after_id": random.choice(user_ids), "limit": 20},
+            )
+
+        result = await run_load(
+            base_url, "/user", N_CLIENTS, N_REQUESTS, send
+        )
+    latency = result["latency_ms"]
+    print(
+        f"{name:<12} {result['rps']:8.1f} req/s  "
+        f"p50 {latency['p50']:7.1f} ms  p99 {latency['p99']:7.1f} ms  "
+        f"errors {result['errors']}"
+    )
+
+
+async def main():
+    print(f"{N_REQUESTS} requests from {N_CLIENTS} concurrent clients")
+    with tempfile.TemporaryDirectory() as directory:
+        await benchmark("threadpool", "main:app", Path(directory))
+        await benchmark("aiosqlite", "main_async:app", Path(directory))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,104 @@
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, sessionmaker
+
+from database import Base, User, make_engine
+from main import UserBody, delete_user, update_user
+from sharding import ShardedSession
+
+N_USERS = 2_000
+
+
+# The select / mutate / commit / refresh versions, kept as the baseline
+def update_user_select_first(user_id: int, user: UserBody, db: Session):
+    db_user = db.query(User).filter(User.id == user_id).first()
+    db_user.name = user.name
+    db_user.email = user.email
+    db.commit()
+    db.refresh(db_user)
+    return db_user
+
+
+def delete_user_select_first(user_id: int, db: Session):
+    db_user = db.query(User).filter(User.id == user_id).first()
+    db.delete(db_user)
+    db.commit()
+    return {"detail": "User deleted"}
+
+
+def measure(engine, name: str, call):
+    statements = 0
+
+    def count_statement(*args):
+        nonlocal statements
+        statements += 1
+
+    event.listen(engine, "before_cursor_execute", count_statement)
+    latencies = []
+    session_factory = sessionmaker(bind=engine)
+    for user_id in range(1, N_USERS + 1):
+        db = ShardedSession([session_factory])
+        begin = time.perf_counter()
+        call(user_id, db)
+        latencies.append(time.perf_counter() - begin)
+        db.close()
+    event.remove(engine, "before_cursor_execute", count_statement)
+
+    cuts = statistics.quantiles(latencies, n=100)
+    print(
+        f"{name:<26} {statements / N_USERS:4.1f} statements/request  "
+        f"p50 {cuts[49] * 1000:6.3f} ms  p99 {cuts[98] * 1000:6.3f} ms"
+    )
+
+
+def seed(engine):
+    with Session(engine) as db:
+        db.execute(User.__table__.delete())
+        db.add_all(
+            User(name=f"user{n}", email=f"user{n}@example.com")
+            for n in range(N_USERS)
+        )
+        db.commit()
+
+
+def main():
+    def body(user_id: int) -> UserBody:
+        return UserBody(
+            name="updated", email=f"updated{user_id}@example.com"
+        )
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = make_engine(f"sqlite:///{Path(directory) / 'bench.db'}")
+        Base.metadata.create_all(bind=engine)
+
+        seed(engine)
+        measure(
+            engine, "update (select first)",
+            lambda user_id, db: update_user_select_first(
+                user_id, body(user_id), db.shard(0)
+            ),
+        )
+        measure(
+            engine, "update (RETURNING)",
+            lambda user_id, db: update_user(user_id, body(user_id), db),
+        )
+        measure(
+            engine, "delete (select first)",
+            lambda user_id, db: delete_user_select_first(
+                user_id, db.shard(0)
+            ),
+        )
+        seed(engine)
+        measure(
+            engine, "delete (RETURNING)",
+            lambda user_id, db: delete_user(user_id, db),
+        )
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import random
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from database import SQLITE_PROFILES, Base, User, make_engine
+
+DURATION = 5.0
+N_READERS = 4
+N_WRITERS = 2
+SEED_ROWS = 10_000
+
+
+def reader(engine, stop: threading.Event, counts: dict):
+    with Session(engine) as session:
+        while not stop.is_set():
+            user_id = random.randint(1, SEED_ROWS)
+            try:
+                session.execute(
+                    select(User).where(User.id == user_id)
+                ).scalar_one_or_none()
+                session.execute(select(func.count(User.id))).scalar()
+                session.rollback()
+                counts["reads"] += 1
+            except OperationalError:
+                session.rollback()
+                counts["errors"] += 1
+
+
+def writer(engine, stop: threading.Event, counts: dict):
+    with Session(engine) as session:
+        while not stop.is_set():
+            try:
+                session.add(
+                    User(name="writer", email=f"{uuid.uuid4()}@example.com")
+                )
+                session.commit()
+                counts["writes"] += 1
+            except OperationalError:
+                session.rollback()
+                counts["errors"] += 1
+
+
+def run_profile(profile: str, directory: Path) -> dict:
+    engine = make_engine(
+        f"sqlite:///{directory / f'{profile}.db'}", profile=profile
+    )
+    Base.metadata.create_all(bind=engine)
+    with Session(engine) as session:
+        session.add_all(
+            User(name=f"user{n}", email=f"user{n}@example.com")
+            for n in range(SEED_ROWS)
+        )
+        session.commit()
+
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=reader, args=(engine, stop, counts))
+        for _ in range(N_READERS)
+    ] + [
+        threading.Thread(target=writer, args=(engine, stop, counts))
+        for _ in range(N_WRITERS)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(DURATION)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    return {name: count / DURATION for name, count in counts.items()}
+
+
+def main():
+    print(f"{N_READERS} readers + {N_WRITERS} writers for {DURATION}s")
+    with tempfile.TemporaryDirectory() as directory:
+        for profile in SQLITE_PROFILES:
+            result = run_profile(profile, Path(directory))
+            print(
+                f"{profile:<12} reads/s {result['reads']:9.1f}  "
+                f"writes/s {result['writes']:8.1f}  "
+                f"errors/s {result['errors']:6.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
+import os
+
 from sqlalchemy.orm import (DeclarativeBase, Mapped, mapped_column, sessionmaker)
-from sqlalchemy import (create_engine)
+from sqlalchemy import (create_engine, event, func, inspect, select)
+from sqlalchemy.ext.asyncio import (async_sessionmaker, create_async_engine)
+from search import create_search_index
 
 class Base(DeclarativeBase):
     pass
@@ -10,14 +14,170 @@ class User(Base):
         primary_key=True,
     )
     name: Mapped[str]
-    email: Mapped[str]
-  
-DATABASE_URL = "sqlite:///./test.db"
-    
-engine = create_engine(DATABASE_URL)
+    email: Mapped[str] = mapped_column(index=True, unique=True)
+
+class DirectoryBase(DeclarativeBase):
+    pass
+
+class UserEmail(DirectoryBase):
+    # Which user owns each email across all shards; only used, and only
+    # created, when there is more than one shard
+    __tablename__ = "user_email"
+    email: Mapped[str] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(index=True)
+
+# PRAGMAs applied to every new connection. "default" leaves SQLite's
+# stock settings: rollback journal, full fsync, writers block readers.
+SQLITE_PROFILES = {
+    "default": {},
+    "production": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,
+        "cache_size": -64000,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+    # Throwaway databases: no durability at all
+    "test": {
+        "journal_mode": "MEMORY",
+        "synchronous": "OFF",
+        "busy_timeout": 5000,
+        "cache_size": -64000,
+        "temp_store": "MEMORY",
+    },
+}
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "production")
+# With more than one shard, user rows are spread over one SQLite file
+# per shard so that writers to different shards do not serialize
+SQLITE_SHARDS = int(os.getenv("SQLITE_SHARDS", "1"))
+SHARD_URL_TEMPLATE = os.getenv(
+    "SHARD_URL_TEMPLATE", "sqlite:///./users_shard{shard}.db"
+)
+# Keeps emails unique across shards; see UserEmail
+DIRECTORY_URL = os.getenv(
+    "DIRECTORY_URL", "sqlite:///./users_directory.db"
+)
+
+def apply_sqlite_profile(engine, profile: str):
+    pragmas = SQLITE_PROFILES[profile]
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+def make_engine(url: str = DATABASE_URL, profile: str = SQLITE_PROFILE):
+    engine = create_engine(
+        url, connect_args={"check_same_thread": False}
+    )
+    apply_sqlite_profile(engine, profile)
+    return engine
+
+def make_async_engine(
+    url: str = DATABASE_URL, profile: str = SQLITE_PROFILE
+):
+    engine = create_async_engine(
+        url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+    )
+    apply_sqlite_profile(engine.sync_engine, profile)
+    return engine
+
+def shard_urls() -> list[str]:
+    if SQLITE_SHARDS == 1:
+        return [DATABASE_URL]
+    return [
+        SHARD_URL_TEMPLATE.format(shard=shard)
+        for shard in range(SQLITE_SHARDS)
+    ]
+
+def check_unique_emails(engine):
+    # Databases created before ix_user_email was unique can hold rows
+    # that share an email, and CREATE UNIQUE INDEX on them only says
+    # "UNIQUE constraint failed". Each shard file is checked on its own
+    with engine.connect() as connection:
+        duplicates = connection.execute(
+            select(User.email, func.count())
+            .group_by(User.email)
+            .having(func.count() > 1)
+            .limit(5)
+        ).all()
+    if duplicates:
+        listed = ", ".join(
+            f"{email!r} in {count} rows" for email, count in duplicates
+        )
+        raise RuntimeError(
+            f"Cannot create the unique index ix_user_email in "
+            f"{engine.url}: {listed}. Update or delete the extra rows in "
+            f"its user table, then restart to create the index."
+        )
+
+def create_schema(engine):
+    Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist, so indexes added
+    # after the table was first created are created here
+    existing = {
+        index["name"] for index in inspect(engine).get_indexes("user")
+    }
+    for index in User.__table__.indexes:
+        if index.name in existing:
+            continue
+        if index.unique:
+            check_unique_emails(engine)
+        index.create(bind=engine)
+    create_search_index(engine)
+
+engines = [make_engine(url) for url in shard_urls()]
+
+for engine in engines:
+    create_schema(engine)
+
+shard_sessionmakers = [
+    sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    for engine in engines
+]
+
+def create_directory(engine, shard_engines):
+    if inspect(engine).has_table(UserEmail.__tablename__):
+        return
+    DirectoryBase.metadata.create_all(bind=engine)
+    # Shards that already hold users are indexed once, when the
+    # directory is first created
+    with engine.begin() as connection:
+        for shard_engine in shard_engines:
+            with shard_engine.connect() as shard:
+                rows = shard.execute(select(User.email, User.id)).all()
+            if rows:
+                connection.execute(
+                    UserEmail.__table__.insert(),
+                    [{"email": email, "user_id": id} for email, id in rows],
+                )
+
+directory_sessionmaker = None
+if SQLITE_SHARDS > 1:
+    directory_engine = make_engine(DIRECTORY_URL)
+    create_directory(directory_engine, engines)
+    directory_sessionmaker = sessionmaker(
+        autocommit=False, autoflush=False, bind=directory_engine
+    )
 
-Base.metadata.create_all(bind=engine)
+def make_async_sessionmakers():
+    # Used by main_async.py; the schema is still created through the
+    # sync engines above. Returns every engine (for disposal), the
+    # shard sessionmakers and the directory sessionmaker, if any
+    def make_sessionmaker(engine):
+        return async_sessionmaker(
+            engine, autoflush=False, expire_on_commit=False
+        )
 
-SessionLocal = sessionmaker(
-    autocommit=False, autoflush=False, bind=engine
-)
\ No newline at end of file
+    async_engines = [make_async_engine(url) for url in shard_urls()]
+    sessionmakers = [make_sessionmaker(engine) for engine in async_engines]
+    async_directory_sessionmaker = None
+    if SQLITE_SHARDS > 1:
+        async_engines.append(make_async_engine(DIRECTORY_URL))
+        async_directory_sessionmaker = make_sessionmaker(async_engines[-1])
+    return async_engines, sessionmakers, async_directory_sessionmaker
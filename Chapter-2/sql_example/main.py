@@ -1,10 +1,23 @@
-from database import SessionLocal, User
-from fastapi import Depends, FastAPI, HTTPException
-from pydantic import BaseModel
-from sqlalchemy.om import Session
+from database import directory_sessionmaker, shard_sessionmakers
+from search import SEARCH_QUERY, fts_match_query
+from sharding import ShardedSession
+from users import (
+    BULK_UPSERT_CHUNK_SIZE,
+    UserBody,
+    add_user,
+    bulk_upsert,
+    change_user,
+    get_user_query,
+    merge_search_pages,
+    merge_users_pages,
+    remove_user,
+    user_not_found,
+    users_page_query,
+)
+from fastapi import Depends, FastAPI, Query
 
 def get_db():
-    db = SessionLocal()
+    db = ShardedSession(shard_sessionmakers, directory_sessionmaker)
     try:
         yield db
     finally:
@@ -13,86 +26,72 @@ def get_db():
 app = FastAPI()
 
 @app.get("/users/")
-def read_users(db: Session = Depends(get_db)):
-    users = db.query(User).all()
-    return users
+def read_users(
+    after_id: int | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+    fields: str | None = None,
+    db: ShardedSession = Depends(get_db),
+):
+    query = users_page_query(after_id, limit, fields)
+    pages = [
+        session.execute(query).mappings().all()
+        for session in db.all_shards()
+    ]
+    return merge_users_pages(pages, limit)
+
+@app.get("/users/search")
+def search_users(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    db: ShardedSession = Depends(get_db),
+):
+    match = fts_match_query(q)
+    if not match:
+        return []
+    pages = [
+        session.execute(
+            SEARCH_QUERY, {"match": match, "limit": limit}
+        ).mappings().all()
+        for session in db.all_shards()
+    ]
+    return merge_search_pages(pages, limit)
 
-class UserBody(BaseModel):
-    name: str
-    email: str
-    
 @app.post("/user/")
 def add_new_user( user: UserBody,
-    db: Session = Depends(get_db) ):
-    new_user = User(
-        name=user.name,
-        email=user.email
-    )
-    
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
-    return new_user
+    db: ShardedSession = Depends(get_db) ):
+    return add_user(db, user)
+
+@app.post("/users/bulk")
+def upsert_users(
+    users: list[UserBody],
+    chunk_size: int = Query(BULK_UPSERT_CHUNK_SIZE, ge=1, le=50000),
+    db: ShardedSession = Depends(get_db),
+):
+    return bulk_upsert(db, users, chunk_size)
 
 @app.get("/user")
 def get_user(
     user_id: int,
-    db: Session = Depends(get_db)
+    db: ShardedSession = Depends(get_db)
     ):
-    user = (
-        db.query(User).filter(
-            User.id == user_id
-        ).first()
-    )
+    user = db.for_id(user_id).execute(
+        get_user_query(user_id)
+    ).mappings().first()
     if user is None:
-        raise HTTPException(
-            status_code=404,
-            detail="User not found"
-    )
+        raise user_not_found()
     return user
 
 @app.post("/user/{user_id}")
 def update_user(
     user_id: int,
     user: UserBody,
-    db: Session = Depends(get_db)
+    db: ShardedSession = Depends(get_db)
     ):
-    db_user = (
-        db.query(User).filter(
-            User.id == user_id
-        ).first()
-    )
-    
-    if db_user is None:
-        raise HTTPException(
-            status_code=404,
-            detail="User not found"
-    )
-    
-    db_user.name = user.name
-    db_user.email = user.email
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+    return change_user(db, user_id, user)
 
 @app.delete("/user/{user_id}")
 def delete_user(
     user_id: int,
-    db: Session = Depends(get_db)
+    db: ShardedSession = Depends(get_db)
     ):
-    db_user = (
-        db.query(User).filter(
-            User.id == user_id
-        ).first()
-    )
-    
-    if db_user is None:
-        raise HTTPException(
-            status_code=404,
-            detail="User not found"
-    )
-    
-    db.delete(db_user)
-    db.commit()
-    return {"detail": "User deleted"}
-     
\ No newline at end of file
+    return remove_user(db, user_id)
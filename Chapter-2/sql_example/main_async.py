@@ -0,0 +1,125 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from database import make_async_sessionmakers
+from search import SEARCH_QUERY, fts_match_query
+from sharding import AsyncShardedSession
+from users import (
+    BULK_UPSERT_CHUNK_SIZE,
+    UserBody,
+    add_user,
+    bulk_upsert,
+    change_user,
+    get_user_query,
+    merge_search_pages,
+    merge_users_pages,
+    remove_user,
+    user_not_found,
+    users_page_query,
+)
+from fastapi import Depends, FastAPI, Query
+
+# The routes of main.py served from the event loop through aiosqlite,
+# instead of from the threadpool: uvicorn main_async:app
+
+class AsyncDatabase:
+    engines = []
+    sessionmakers = []
+    directory_sessionmaker = None
+
+database = AsyncDatabase()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    (
+        database.engines,
+        database.sessionmakers,
+        database.directory_sessionmaker,
+    ) = make_async_sessionmakers()
+    yield
+    for engine in database.engines:
+        await engine.dispose()
+
+async def get_db():
+    db = AsyncShardedSession(
+        database.sessionmakers, database.directory_sessionmaker
+    )
+    try:
+        yield db
+    finally:
+        await db.close()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.get("/users/")
+async def read_users(
+    after_id: int | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+    fields: str | None = None,
+    db: AsyncShardedSession = Depends(get_db),
+):
+    query = users_page_query(after_id, limit, fields)
+    results = await asyncio.gather(
+        *(session.execute(query) for session in db.all_shards())
+    )
+    pages = [result.mappings().all() for result in results]
+    return merge_users_pages(pages, limit)
+
+@app.get("/users/search")
+async def search_users(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncShardedSession = Depends(get_db),
+):
+    match = fts_match_query(q)
+    if not match:
+        return []
+    results = await asyncio.gather(
+        *(
+            session.execute(
+                SEARCH_QUERY, {"match": match, "limit": limit}
+            )
+            for session in db.all_shards()
+        )
+    )
+    pages = [result.mappings().all() for result in results]
+    return merge_search_pages(pages, limit)
+
+@app.post("/user/")
+async def add_new_user( user: UserBody,
+    db: AsyncShardedSession = Depends(get_db) ):
+    return await db.run_sync(add_user, user)
+
+@app.post("/users/bulk")
+async def upsert_users(
+    users: list[UserBody],
+    chunk_size: int = Query(BULK_UPSERT_CHUNK_SIZE, ge=1, le=50000),
+    db: AsyncShardedSession = Depends(get_db),
+):
+    return await db.run_sync(bulk_upsert, users, chunk_size)
+
+@app.get("/user")
+async def get_user(
+    user_id: int,
+    db: AsyncShardedSession = Depends(get_db)
+    ):
+    result = await db.for_id(user_id).execute(get_user_query(user_id))
+    user = result.mappings().first()
+    if user is None:
+        raise user_not_found()
+    return user
+
+@app.post("/user/{user_id}")
+async def update_user(
+    user_id: int,
+    user: UserBody,
+    db: AsyncShardedSession = Depends(get_db)
+    ):
+    return await db.run_sync(change_user, user_id, user)
+
+@app.delete("/user/{user_id}")
+async def delete_user(
+    user_id: int,
+    db: AsyncShardedSession = Depends(get_db)
+    ):
+    return await db.run_sync(remove_user, user_id)
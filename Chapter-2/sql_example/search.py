@@ -0,0 +1,70 @@
+import re
+
+from sqlalchemy import text
+
+# External-content FTS5 index over user(name, email): the text lives
+# only in the user table, the triggers keep the index in step with it
+SEARCH_INDEX_DDL = [
+    """
+    CREATE VIRTUAL TABLE user_fts USING fts5(
+        name, email,
+        content='user', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS user_fts_ai AFTER INSERT ON user BEGIN
+        INSERT INTO user_fts(rowid, name, email)
+        VALUES (new.id, new.name, new.email);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS user_fts_ad AFTER DELETE ON user BEGIN
+        INSERT INTO user_fts(user_fts, rowid, name, email)
+        VALUES ('delete', old.id, old.name, old.email);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS user_fts_au AFTER UPDATE ON user BEGIN
+        INSERT INTO user_fts(user_fts, rowid, name, email)
+        VALUES ('delete', old.id, old.name, old.email);
+        INSERT INTO user_fts(rowid, name, email)
+        VALUES (new.id, new.name, new.email);
+    END
+    """,
+    # Index the rows that existed before the triggers did
+    "INSERT INTO user_fts(user_fts) VALUES ('rebuild')",
+]
+
+# Matches in name count double against matches in email; lower scores
+# rank higher
+SEARCH_QUERY = text(
+    """
+    SELECT user.id, user.name, user.email,
+           bm25(user_fts, 2.0, 1.0) AS score
+    FROM user_fts JOIN user ON user.id = user_fts.rowid
+    WHERE user_fts MATCH :match
+    ORDER BY score
+    LIMIT :limit
+    """
+)
+
+def create_search_index(engine):
+    with engine.begin() as connection:
+        exists = connection.execute(
+            text(
+                "SELECT 1 FROM sqlite_master "
+                "WHERE type = 'table' AND name = 'user_fts'"
+            )
+        ).first()
+        if exists:
+            return
+        for statement in SEARCH_INDEX_DDL:
+            connection.execute(text(statement))
+
+def fts_match_query(q: str) -> str:
+    # Each word becomes a quoted prefix term, so user input can never
+    # be read as FTS5 query syntax; terms are ANDed together
+    terms = re.findall(r"\w+", q)
+    return " ".join(f'"{term}"*' for term in terms)
@@ -0,0 +1,271 @@
+import zlib
+
+from sqlalchemy import delete, false, func, select, tuple_, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, sessionmaker
+
+from database import User, UserEmail
+
+# A user lives in shard id % shard_count. New users are placed by a
+# hash of their email, and get an id from that shard's own sequence
+# (shard, shard + n, shard + 2n, ...), so no shard needs to ask another
+# for an id.
+#
+# An email change keeps the user (and its id) in its shard, so after
+# one the email hash no longer says where the user is. With more than
+# one shard, the UserEmail directory therefore records the owner of
+# every email: it is what keeps emails unique across shards and what
+# the bulk upsert uses to find existing users. Claims are made before
+# the shard transaction commits and released if it does not; a claim
+# left behind by a process that died in between points at a user that
+# does not exist, and is taken over by the next user to claim the email.
+
+# Emails per IN (...) lookup, below SQLite's bound parameter limit
+DIRECTORY_LOOKUP_CHUNK = 500
+
+
+class EmailTaken(Exception):
+    pass
+
+
+def email_owners_query(emails: list[str]):
+    return select(UserEmail.email, UserEmail.user_id).where(
+        UserEmail.email.in_(emails)
+    )
+
+
+def email_owner_query(email: str):
+    return select(UserEmail.user_id).where(UserEmail.email == email)
+
+
+def claim_email_statement(email: str, user_id: int):
+    return insert(UserEmail).values(email=email, user_id=user_id)
+
+
+def claim_emails_statement():
+    return insert(UserEmail).on_conflict_do_nothing(
+        index_elements=[UserEmail.email]
+    )
+
+
+def take_over_claim_statement(email: str, stale_owner: int, user_id: int):
+    return (
+        update(UserEmail)
+        .where(UserEmail.email == email, UserEmail.user_id == stale_owner)
+        .values(user_id=user_id)
+    )
+
+
+def lock_shard_statement():
+    # Deletes nothing, but takes the shard's write lock, so it waits for
+    # any transaction still inserting a user there
+    return delete(User).where(false())
+
+
+def user_exists_query(user_id: int):
+    return select(User.id).where(User.id == user_id)
+
+
+def release_emails_statement(user_id: int, keep: str | None = None):
+    statement = delete(UserEmail).where(UserEmail.user_id == user_id)
+    if keep is not None:
+        statement = statement.where(UserEmail.email != keep)
+    return statement
+
+
+def release_claims_statement(claims: list[tuple[str, int]]):
+    return delete(UserEmail).where(
+        tuple_(UserEmail.email, UserEmail.user_id).in_(claims)
+    )
+
+
+def users_by_email_query(emails: list[str]):
+    return select(User.email, User.id).where(User.email.in_(emails))
+
+
+def chunks(items: list, size: int = DIRECTORY_LOOKUP_CHUNK):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class ShardedSession:
+    def __init__(
+        self,
+        session_factories: list[sessionmaker],
+        directory_factory: sessionmaker | None = None,
+    ):
+        self.session_factories = session_factories
+        self.directory_factory = directory_factory
+        self._sessions: dict[int, Session] = {}
+
+    @property
+    def shard_count(self) -> int:
+        return len(self.session_factories)
+
+    def shard(self, shard: int) -> Session:
+        if shard not in self._sessions:
+            self._sessions[shard] = self.session_factories[shard]()
+        return self._sessions[shard]
+
+    def shard_for_id(self, user_id: int) -> int:
+        return user_id % self.shard_count
+
+    def shard_for_email(self, email: str) -> int:
+        # Placement of new users only; existing users are found by id
+        return zlib.crc32(email.encode()) % self.shard_count
+
+    def for_id(self, user_id: int) -> Session:
+        return self.shard(self.shard_for_id(user_id))
+
+    def all_shards(self) -> list[Session]:
+        return [self.shard(shard) for shard in range(self.shard_count)]
+
+    def email_owners(self, emails: list[str]) -> dict[str, int]:
+        if self.directory_factory is None:
+            return {}
+        with self.directory_factory() as directory:
+            return {
+                email: user_id
+                for chunk in chunks(emails)
+                for email, user_id in directory.execute(
+                    email_owners_query(chunk)
+                )
+            }
+
+    def claim_email(self, email: str, user_id: int) -> bool:
+        # True if the claim is new, False if user_id already owned the
+        # email; EmailTaken if another user owns it
+        if self.directory_factory is None:
+            return False
+        with self.directory_factory() as directory:
+            try:
+                directory.execute(claim_email_statement(email, user_id))
+                directory.commit()
+                return True
+            except IntegrityError:
+                directory.rollback()
+            owner = directory.execute(email_owner_query(email)).scalar()
+            if owner not in (None, user_id) and self.take_over_claim(
+                directory, email, owner, user_id
+            ):
+                return True
+        if owner != user_id:
+            raise EmailTaken(email)
+        return False
+
+    def claim_emails(
+        self, claims: list[tuple[str, int]]
+    ) -> list[tuple[str, int]]:
+        # Returns the new claims; EmailTaken (with every new claim
+        # released again) if any email is owned by another user
+        if self.directory_factory is None or not claims:
+            return []
+        wanted = dict(claims)
+        owners = self.email_owners(list(wanted))
+        new_claims = [
+            (email, user_id) for email, user_id in claims
+            if email not in owners
+        ]
+        with self.directory_factory() as directory:
+            for chunk in chunks(new_claims):
+                directory.execute(
+                    claim_emails_statement(),
+                    [
+                        {"email": email, "user_id": user_id}
+                        for email, user_id in chunk
+                    ],
+                )
+            directory.commit()
+        # Checked after inserting, as another request may have claimed
+        # some of the emails in between
+        owners = self.email_owners(list(wanted))
+        taken = [
+            email for email in wanted if owners.get(email) != wanted[email]
+        ]
+        if taken:
+            with self.directory_factory() as directory:
+                for email in list(taken):
+                    if owners.get(email) is not None and self.take_over_claim(
+                        directory, email, owners[email], wanted[email]
+                    ):
+                        taken.remove(email)
+                        new_claims.append((email, wanted[email]))
+        if taken:
+            self.release_claims(new_claims)
+            raise EmailTaken(taken[0])
+        return new_claims
+
+    def owner_exists(self, user_id: int) -> bool:
+        # Checked in this request's session for the owner's shard once it
+        # holds the shard's write lock, so a user whose insert is still
+        # in flight is not mistaken for a missing one
+        session = self.for_id(user_id)
+        session.execute(lock_shard_statement())
+        return session.execute(user_exists_query(user_id)).first() is not None
+
+    def take_over_claim(
+        self, directory: Session, email: str, stale_owner: int, user_id: int
+    ) -> bool:
+        if self.owner_exists(stale_owner):
+            return False
+        result = directory.execute(
+            take_over_claim_statement(email, stale_owner, user_id)
+        )
+        directory.commit()
+        return result.rowcount == 1
+
+    def release_claims(self, claims: list[tuple[str, int]]):
+        if self.directory_factory is None or not claims:
+            return
+        with self.directory_factory() as directory:
+            for chunk in chunks(claims):
+                directory.execute(release_claims_statement(chunk))
+            directory.commit()
+
+    def release_emails(self, user_id: int, keep: str | None = None):
+        if self.directory_factory is None:
+            return
+        with self.directory_factory() as directory:
+            directory.execute(release_emails_statement(user_id, keep))
+            directory.commit()
+
+    def close(self):
+        for session in self._sessions.values():
+            session.close()
+        self._sessions.clear()
+
+
+class AsyncShardedSession(ShardedSession):
+    # Same routing over AsyncSession factories. Multi-step writes and the
+    # directory logic are not repeated here: run_sync runs the sync code
+    # against the sessions behind this one's AsyncSessions
+    async def run_sync(self, fn, *args):
+        sync_db = ShardedSession(
+            [
+                lambda shard=shard: self.shard(shard).sync_session
+                for shard in range(self.shard_count)
+            ],
+            self.directory_factory and (
+                lambda: self.directory_factory().sync_session
+            ),
+        )
+        # Any AsyncSession can provide the greenlet that lets sync
+        # sessions of async engines run; shard 0 always exists
+        return await self.shard(0).run_sync(
+            lambda _: fn(sync_db, *args)
+        )
+
+    async def close(self):
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions.clear()
+
+
+def next_user_id(shard: int, shard_count: int):
+    # Evaluated inside the INSERT, under the shard's write lock
+    first_id = shard or shard_count
+    return select(
+        func.coalesce(func.max(User.id), first_id - shard_count)
+        + shard_count
+    ).scalar_subquery()
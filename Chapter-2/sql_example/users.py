@@ -0,0 +1,238 @@
+import heapq
+from collections import defaultdict
+from itertools import islice
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import IntegrityError
+
+from database import User
+from sharding import (
+    EmailTaken,
+    ShardedSession,
+    chunks,
+    next_user_id,
+    users_by_email_query,
+)
+
+# Statements, result merging and the multi-step writes shared by the
+# threadpool app (main.py) and the asyncio app (main_async.py). The
+# writes take a sync ShardedSession; main_async.py runs them through
+# AsyncShardedSession.run_sync
+
+BULK_UPSERT_CHUNK_SIZE = 1000
+
+USER_COLUMNS = {
+    column.key: column for column in User.__table__.columns
+}
+
+
+class UserBody(BaseModel):
+    name: str
+    email: str
+
+
+def users_page_query(
+    after_id: int | None, limit: int, fields: str | None
+):
+    selected = list(USER_COLUMNS)
+    if fields:
+        selected = [field.strip() for field in fields.split(",")]
+        unknown = set(selected) - USER_COLUMNS.keys()
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown fields: {', '.join(sorted(unknown))}"
+            )
+        # id is the pagination cursor, so it is always returned
+        if "id" not in selected:
+            selected.insert(0, "id")
+    query = (
+        select(*(USER_COLUMNS[field] for field in selected))
+        .order_by(User.id)
+        .limit(limit)
+    )
+    if after_id is not None:
+        query = query.where(User.id > after_id)
+    return query
+
+
+def merge_users_pages(pages: list, limit: int) -> list:
+    # Each shard returns its first `limit` rows in id order; merging
+    # those gives the first `limit` rows overall
+    return list(
+        islice(heapq.merge(*pages, key=lambda row: row["id"]), limit)
+    )
+
+
+def merge_search_pages(pages: list, limit: int) -> list[dict]:
+    # bm25 is computed by each shard from its own document counts and
+    # term frequencies, so scores from different shards are only
+    # roughly comparable: the merged order is exact within a shard and
+    # approximate across shards, and more so the smaller the shards
+    ranked = heapq.merge(*pages, key=lambda row: row["score"])
+    return [
+        {"id": row["id"], "name": row["name"], "email": row["email"]}
+        for row in islice(ranked, limit)
+    ]
+
+
+def route_bulk_rows(
+    users: list[UserBody], owners: dict[str, int], db
+) -> dict[int, list[dict]]:
+    # Known emails go to the shard their owner lives in, new ones to the
+    # shard their hash picks
+    rows_by_shard = defaultdict(list)
+    for user in users:
+        owner = owners.get(user.email)
+        shard = (
+            db.shard_for_id(owner) if owner is not None
+            else db.shard_for_email(user.email)
+        )
+        rows_by_shard[shard].append(user.model_dump())
+    return rows_by_shard
+
+
+def get_user_query(user_id: int):
+    return select(User.id, User.name, User.email).where(User.id == user_id)
+
+
+def insert_user_statement(user: UserBody, shard: int, shard_count: int):
+    return (
+        insert(User)
+        .values(
+            id=next_user_id(shard, shard_count),
+            name=user.name,
+            email=user.email,
+        )
+        .returning(User.id, User.name, User.email)
+    )
+
+
+def upsert_users_statement(shard: int, shard_count: int):
+    # Users are matched on email; a known email gets its name updated
+    statement = insert(User.__table__).values(
+        id=next_user_id(shard, shard_count)
+    )
+    return statement.on_conflict_do_update(
+        index_elements=[User.email],
+        set_={"name": statement.excluded.name},
+    )
+
+
+def update_user_statement(user_id: int, user: UserBody):
+    return (
+        update(User)
+        .where(User.id == user_id)
+        .values(name=user.name, email=user.email)
+        .returning(User.id, User.name, User.email)
+    )
+
+
+def delete_user_statement(user_id: int):
+    return delete(User).where(User.id == user_id).returning(User.id)
+
+
+def email_taken() -> HTTPException:
+    return HTTPException(status_code=409, detail="Email already registered")
+
+
+def user_not_found() -> HTTPException:
+    return HTTPException(status_code=404, detail="User not found")
+
+
+def add_user(db: ShardedSession, user: UserBody):
+    shard = db.shard_for_email(user.email)
+    session = db.shard(shard)
+    try:
+        new_user = session.execute(
+            insert_user_statement(user, shard, db.shard_count)
+        ).mappings().one()
+        db.claim_email(user.email, new_user["id"])
+    except (IntegrityError, EmailTaken):
+        session.rollback()
+        raise email_taken()
+    try:
+        session.commit()
+    except Exception:
+        db.release_claims([(user.email, new_user["id"])])
+        raise
+    return new_user
+
+
+def bulk_upsert(
+    db: ShardedSession, users: list[UserBody], chunk_size: int
+):
+    owners = db.email_owners([user.email for user in users])
+    rows_by_shard = route_bulk_rows(users, owners, db)
+    # One transaction per shard; all shards commit once every chunk
+    # has been written
+    for shard, rows in rows_by_shard.items():
+        statement = upsert_users_statement(shard, db.shard_count)
+        for start in range(0, len(rows), chunk_size):
+            db.shard(shard).execute(
+                statement, rows[start:start + chunk_size]
+            )
+    new_claims = []
+    if db.directory_factory is not None:
+        claims = []
+        for shard, rows in rows_by_shard.items():
+            for chunk in chunks([row["email"] for row in rows]):
+                claims.extend(
+                    db.shard(shard).execute(
+                        users_by_email_query(chunk)
+                    ).tuples().all()
+                )
+        try:
+            new_claims = db.claim_emails(claims)
+        except EmailTaken:
+            for shard in rows_by_shard:
+                db.shard(shard).rollback()
+            raise email_taken()
+    try:
+        for shard in rows_by_shard:
+            db.shard(shard).commit()
+    except Exception:
+        db.release_claims(new_claims)
+        raise
+    return {"upserted": len(users)}
+
+
+def change_user(db: ShardedSession, user_id: int, user: UserBody):
+    # The user stays in its shard; the email directory keeps the new
+    # email unique across shards
+    session = db.for_id(user_id)
+    try:
+        claimed = db.claim_email(user.email, user_id)
+    except EmailTaken:
+        raise email_taken()
+    try:
+        db_user = session.execute(
+            update_user_statement(user_id, user)
+        ).mappings().first()
+    except IntegrityError:
+        if claimed:
+            db.release_claims([(user.email, user_id)])
+        raise email_taken()
+
+    if db_user is None:
+        if claimed:
+            db.release_claims([(user.email, user_id)])
+        raise user_not_found()
+
+    session.commit()
+    if claimed:
+        db.release_emails(user_id, keep=user.email)
+    return db_user
+
+
+def remove_user(db: ShardedSession, user_id: int):
+    session = db.for_id(user_id)
+    deleted_id = session.execute(delete_user_statement(user_id)).scalar()
+    if deleted_id is None:
+        raise user_not_found()
+    session.commit()
+    db.release_emails(user_id)
+    return {"detail": "User deleted"}
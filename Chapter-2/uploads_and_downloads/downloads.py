@@ -0,0 +1,82 @@
+import os
+import stat
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+
+import anyio
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import FileResponse
+
+# FileResponse already answers Range / If-Range requests (206, multipart
+# byteranges for several ranges, 416 when unsatisfiable) against the
+# ETag and Last-Modified headers it is given; this module supplies those
+# validators and answers conditional GETs before any file is opened
+
+
+def file_etag(stat_result: os.stat_result) -> str:
+    # Uploads replace files by renaming a new one into place, so inode,
+    # size and nanosecond mtime change whenever the bytes do
+    return (
+        f'"{stat_result.st_ino:x}-{stat_result.st_size:x}-'
+        f'{stat_result.st_mtime_ns:x}"'
+    )
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(
+        candidate.removeprefix("W/") == etag for candidate in candidates
+    )
+
+
+def not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since
+    return False
+
+
+async def file_response(
+    request: Request,
+    path: Path,
+    filename: str,
+    etag: str | None = None,
+    headers: dict | None = None,
+    media_type: str | None = None,
+    last_modified: float | None = None,
+) -> Response:
+    try:
+        stat_result = await anyio.to_thread.run_sync(os.stat, path)
+    except FileNotFoundError:
+        stat_result = None
+    if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    # Blobs are shared between names, so callers that know when the
+    # name itself last changed pass that instead of the file's mtime
+    if last_modified is None:
+        last_modified = stat_result.st_mtime
+    headers = {
+        **(headers or {}),
+        "etag": etag or file_etag(stat_result),
+        "last-modified": formatdate(last_modified, usegmt=True),
+    }
+    if not_modified(request, headers["etag"], last_modified):
+        return Response(status_code=304, headers=headers)
+
+    return FileResponse(
+        path=path,
+        filename=filename,
+        headers=headers,
+        media_type=media_type,
+        stat_result=stat_result,
+    )
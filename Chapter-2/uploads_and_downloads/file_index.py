@@ -0,0 +1,190 @@
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from precompressed import remove_variants
+from storage import (
+    UPLOAD_DIR,
+    StagedUpload,
+    blob_path,
+    content_type_for,
+)
+
+FILE_INDEX_PATH = Path(
+    os.getenv("FILE_INDEX_PATH", UPLOAD_DIR / ".index.db")
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    refcount INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    hash TEXT NOT NULL REFERENCES blobs (hash),
+    content_type TEXT NOT NULL DEFAULT 'application/octet-stream',
+    modified_at REAL NOT NULL DEFAULT 0
+);
+"""
+
+# Columns added to files after the first release of the index, so older
+# index files are upgraded in place
+ADDED_FILE_COLUMNS = {
+    "content_type": "TEXT NOT NULL DEFAULT 'application/octet-stream'",
+    "modified_at": "REAL NOT NULL DEFAULT 0",
+}
+
+FILE_QUERY = (
+    "SELECT files.name, files.hash, blobs.size, files.content_type, "
+    "files.modified_at FROM files JOIN blobs ON blobs.hash = files.hash"
+)
+
+
+def prefix_upper_bound(prefix: str) -> str | None:
+    # Names starting with prefix sort in [prefix, upper bound), which
+    # lets SQLite answer prefix searches from the primary key index
+    if not prefix or prefix[-1] == chr(0x10FFFF):
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class FileIndex:
+    # Maps filenames to blob hashes and counts references per blob.
+    # Methods block, so the app calls them through anyio.to_thread
+    def __init__(self):
+        self.connection = None
+        self.lock = threading.Lock()
+
+    def open(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        columns = {
+            row["name"]
+            for row in self.connection.execute("PRAGMA table_info(files)")
+        }
+        added = [
+            column for column in ADDED_FILE_COLUMNS if column not in columns
+        ]
+        with self.connection:
+            for column in added:
+                self.connection.execute(
+                    f"ALTER TABLE files ADD COLUMN {column} "
+                    f"{ADDED_FILE_COLUMNS[column]}"
+                )
+            if added:
+                self._backfill(added)
+
+    def _backfill(self, columns: list[str]):
+        # Rows from before a column existed get the best value the blob
+        # store can give instead of the column default
+        rows = self.connection.execute(
+            "SELECT name, hash FROM files"
+        ).fetchall()
+        for row in rows:
+            values = {}
+            if "content_type" in columns:
+                values["content_type"] = content_type_for(row["name"])
+            blob = blob_path(row["hash"])
+            if "modified_at" in columns and blob.exists():
+                values["modified_at"] = blob.stat().st_mtime
+            if not values:
+                continue
+            assignments = ", ".join(f"{column} = ?" for column in values)
+            self.connection.execute(
+                f"UPDATE files SET {assignments} WHERE name = ?",
+                (*values.values(), row["name"]),
+            )
+
+    def close(self):
+        self.connection.close()
+        self.connection = None
+
+    def lookup(self, name: str) -> sqlite3.Row | None:
+        with self.lock:
+            return self.connection.execute(
+                f"{FILE_QUERY} WHERE files.name = ?", (name,)
+            ).fetchone()
+
+    def list_files(
+        self, prefix: str = "", after: str | None = None, limit: int = 100
+    ) -> list[sqlite3.Row]:
+        conditions = []
+        parameters = []
+        lower = max(prefix, after) if after is not None else prefix
+        if lower:
+            conditions.append(
+                "files.name > ?" if lower == after else "files.name >= ?"
+            )
+            parameters.append(lower)
+        upper = prefix_upper_bound(prefix)
+        if upper is not None:
+            conditions.append("files.name < ?")
+            parameters.append(upper)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self.lock:
+            return self.connection.execute(
+                f"{FILE_QUERY}{where} ORDER BY files.name LIMIT ?",
+                (*parameters, limit),
+            ).fetchall()
+
+    def add(self, name: str, staged: StagedUpload):
+        # The blob is renamed into place before the rows pointing at it
+        # are committed, and a released blob is unlinked only after its
+        # row is gone, so the index never references a missing file
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT hash FROM files WHERE name = ?", (name,)
+            ).fetchone()
+            previous = row["hash"] if row else None
+            known = self.connection.execute(
+                "SELECT 1 FROM blobs WHERE hash = ?", (staged.digest,)
+            ).fetchone()
+            if known:
+                staged.path.unlink()
+            else:
+                destination = blob_path(staged.digest)
+                destination.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(staged.path, destination)
+
+            with self.connection:
+                if previous != staged.digest:
+                    self.connection.execute(
+                        "INSERT INTO blobs (hash, size, refcount) "
+                        "VALUES (?, ?, 1) ON CONFLICT (hash) "
+                        "DO UPDATE SET refcount = refcount + 1",
+                        (staged.digest, staged.size),
+                    )
+                self.connection.execute(
+                    "INSERT INTO files (name, hash, content_type, modified_at) "
+                    "VALUES (?, ?, ?, ?) ON CONFLICT (name) DO UPDATE SET "
+                    "hash = excluded.hash, "
+                    "content_type = excluded.content_type, "
+                    "modified_at = excluded.modified_at",
+                    (name, staged.digest, staged.content_type, time.time()),
+                )
+                released = (
+                    previous not in (None, staged.digest)
+                    and self._release(previous)
+                )
+            if released:
+                blob_path(previous).unlink(missing_ok=True)
+                remove_variants(previous)
+
+    def _release(self, digest: str) -> bool:
+        self.connection.execute(
+            "UPDATE blobs SET refcount = refcount - 1 WHERE hash = ?",
+            (digest,),
+        )
+        deleted = self.connection.execute(
+            "DELETE FROM blobs WHERE hash = ? AND refcount <= 0", (digest,)
+        )
+        return deleted.rowcount > 0
+
+
+file_index = FileIndex()
@@ -1,22 +1,145 @@
-import shutil
-from fastapi import FastAPI, File, HTTPException, UploadFile
-from pathlib import Path
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+import anyio
+from fastapi import (
+    BackgroundTasks, FastAPI, HTTPException, Query, Request
+)
 from fastapi.responses import FileResponse
+from pydantic import BaseModel
+
+from body_limit import MULTIPART_OVERHEAD, MaxBodySizeMiddleware
+from downloads import file_response
+from file_index import FILE_INDEX_PATH, file_index
+from precompressed import (
+    accepted_encodings,
+    build_variant,
+    find_variant,
+    is_compressible,
+    variant_path,
+)
+from resumable import router as resumable_router
+from storage import (
+    MAX_UPLOAD_SIZE, UPLOAD_DIR, blob_path, save_upload, validate_filename
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    file_index.open(FILE_INDEX_PATH)
+    yield
+    file_index.close()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(
+    MaxBodySizeMiddleware, max_size=MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD
+)
+app.include_router(resumable_router)
+
+class FileInfo(BaseModel):
+    name: str
+    size: int
+    content_type: str
+    hash: str
+    modified_at: datetime
+
+class FileList(BaseModel):
+    files: list[FileInfo]
+    next_after: str | None
+
+@app.get("/files")
+async def list_files(
+    prefix: str = "",
+    after: str | None = None,
+    limit: int = Query(100, ge=1, le=1000),
+) -> FileList:
+    rows = await anyio.to_thread.run_sync(
+        file_index.list_files, prefix, after, limit
+    )
+    files = [
+        FileInfo(
+            name=row["name"],
+            size=row["size"],
+            content_type=row["content_type"],
+            hash=row["hash"],
+            modified_at=datetime.fromtimestamp(
+                row["modified_at"], timezone.utc
+            ),
+        )
+        for row in rows
+    ]
+    next_after = files[-1].name if len(files) == limit else None
+    return FileList(files=files, next_after=next_after)
+
+# The body is parsed by save_upload as it streams in, so the multipart
+# form is described here for the docs instead of with File(...)
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "file": {"type": "string", "format": "binary"},
+                    },
+                    "required": ["file"],
+                },
+            },
+        },
+    },
+}
+
+@app.post("/uploadfile/", openapi_extra=UPLOAD_REQUEST_BODY)
+async def upload_file(request: Request):
+    name, staged = await save_upload(request)
+    await anyio.to_thread.run_sync(file_index.add, name, staged)
 
-app = FastAPI()
+    return {"filename": name}
 
-@app.post("/uploadfile/")
-async def upload_file(file: UploadFile = File(...)):
-    with open(f"uploads/{file.filename}", "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-        
-    return {"filename": file.filename}
+@app.api_route(
+    "/downloadfile/{filename}",
+    methods=["GET", "HEAD"],
+    response_class = FileResponse,
+)
+async def download_file(
+    filename: str, request: Request, background_tasks: BackgroundTasks
+):
+    name = validate_filename(filename)
+    entry = await anyio.to_thread.run_sync(file_index.lookup, name)
+    if entry is None:
+        # Files saved straight into UPLOAD_DIR before the index existed
+        # are served from there until migrate_uploads.py moves them in;
+        # dot names are the index's own files and are never served
+        if name.startswith("."):
+            raise HTTPException(status_code=404, detail="File not found")
+        return await file_response(request, UPLOAD_DIR / name, filename)
+    digest = entry["hash"]
 
-@app.get("/downloadfile/{filename}", response_class = FileResponse)
-async def download_file(filename: str):
-    if not Path(f"uploads/{filename}").exists():
-       raise HTTPException(status_code=404, detail="File not found")
-   
-    return FileResponse(path=f"uploads/{filename}", filename=filename)
+    headers = {"vary": "Accept-Encoding"}
+    encodings = accepted_encodings(
+        request.headers.get("accept-encoding", "")
+    )
+    if encodings and is_compressible(name, entry["size"]):
+        encoding, missing = await anyio.to_thread.run_sync(
+            find_variant, digest, encodings
+        )
+        if missing is not None:
+            # Built after this response; later requests get it
+            background_tasks.add_task(build_variant, digest, missing)
+        if encoding is not None:
+            return await file_response(
+                request,
+                variant_path(digest, encoding),
+                filename,
+                etag=f'"{digest}-{encoding}"',
+                headers={**headers, "content-encoding": encoding},
+                media_type=entry["content_type"],
+                last_modified=entry["modified_at"],
+            )
 
-    
\ No newline at end of file
+    # Identical uploads share one blob, so they also share its page cache
+    return await file_response(
+        request, blob_path(digest), filename, etag=f'"{digest}"',
+        headers=headers, media_type=entry["content_type"],
+        last_modified=entry["modified_at"],
+    )
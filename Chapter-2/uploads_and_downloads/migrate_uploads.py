@@ -0,0 +1,26 @@
+from file_index import FILE_INDEX_PATH, file_index
+from storage import UPLOAD_DIR, StagedUpload, content_type_for, hash_file
+
+
+def main():
+    # Moves files saved directly in UPLOAD_DIR before the blob store
+    # existed into it, keeping their names
+    file_index.open(FILE_INDEX_PATH)
+    migrated = 0
+    for path in sorted(UPLOAD_DIR.iterdir()):
+        if path.name.startswith(".") or not path.is_file():
+            continue
+        staged = StagedUpload(
+            path=path,
+            digest=hash_file(path),
+            size=path.stat().st_size,
+            content_type=content_type_for(path.name),
+        )
+        file_index.add(path.name, staged)
+        migrated += 1
+    print(f"Moved {migrated} files from {UPLOAD_DIR} into the blob store")
+    file_index.close()
+
+
+if __name__ == "__main__":
+    main()
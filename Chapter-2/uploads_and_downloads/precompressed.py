@@ -0,0 +1,166 @@
+import gzip
+import mimetypes
+import os
+import shutil
+import threading
+import uuid
+from pathlib import Path
+
+from storage import UPLOAD_CHUNK_SIZE, blob_path
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Compressed copies of a blob sit next to it as <hash>.<suffix> and are
+# built after the first request that could have used them. Blobs never
+# change, so neither do their variants
+MIN_COMPRESS_SIZE = int(os.getenv("MIN_COMPRESS_SIZE", 1024))
+# A variant must be at least this much smaller than the blob to be kept
+MIN_COMPRESSION_SAVING = 0.1
+
+INCOMPRESSIBLE_TYPES = {
+    "application/gzip",
+    "application/pdf",
+    "application/x-7z-compressed",
+    "application/x-bzip2",
+    "application/x-xz",
+    "application/zip",
+    "application/zstd",
+}
+
+
+def compress_gzip(source, destination):
+    with gzip.GzipFile(
+        fileobj=destination, mode="wb", compresslevel=9, mtime=0
+    ) as compressed:
+        shutil.copyfileobj(source, compressed, UPLOAD_CHUNK_SIZE)
+
+
+def compress_brotli(source, destination):
+    compressor = brotli.Compressor(quality=9)
+    while chunk := source.read(UPLOAD_CHUNK_SIZE):
+        destination.write(compressor.process(chunk))
+    destination.write(compressor.finish())
+
+
+def compress_zstd(source, destination):
+    zstandard.ZstdCompressor(level=15).copy_stream(source, destination)
+
+
+# In the order the server prefers them; encodings whose library is not
+# installed are not offered
+ENCODERS = {
+    encoding: (suffix, compress)
+    for encoding, suffix, compress, available in (
+        ("zstd", "zst", compress_zstd, zstandard is not None),
+        ("br", "br", compress_brotli, brotli is not None),
+        ("gzip", "gz", compress_gzip, True),
+    )
+    if available
+}
+
+building: set[tuple[str, str]] = set()
+building_lock = threading.Lock()
+
+
+def accepted_encodings(accept_encoding: str) -> list[str]:
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, _, parameters = item.strip().partition(";")
+        quality = 1.0
+        parameter, _, value = parameters.strip().partition("=")
+        if parameter.strip() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        if coding:
+            qualities[coding.strip().lower()] = quality
+    wildcard = qualities.get("*", 0.0)
+    return [
+        encoding for encoding in ENCODERS
+        if qualities.get(encoding, wildcard) > 0
+    ]
+
+
+def is_compressible(filename: str, size: int) -> bool:
+    if size < MIN_COMPRESS_SIZE:
+        return False
+    media_type, encoding = mimetypes.guess_type(filename)
+    if encoding is not None:
+        # Already compressed, e.g. .tar.gz
+        return False
+    if media_type is None:
+        # Unknown types such as .log are usually text
+        return True
+    if media_type.startswith(("audio/", "video/")):
+        return False
+    if media_type.startswith("image/"):
+        return media_type == "image/svg+xml"
+    return media_type not in INCOMPRESSIBLE_TYPES
+
+
+def variant_path(digest: str, encoding: str) -> Path:
+    suffix, _ = ENCODERS[encoding]
+    return blob_path(digest).with_name(f"{digest}.{suffix}")
+
+
+def skip_marker(digest: str, encoding: str) -> Path:
+    # Left behind when compressing did not save enough to be worth it
+    path = variant_path(digest, encoding)
+    return path.with_name(f"{path.name}.skip")
+
+
+def find_variant(digest: str, encodings: list[str]):
+    # Returns the best variant already built and the best one still
+    # worth building; each may be None
+    missing = None
+    for encoding in encodings:
+        if variant_path(digest, encoding).exists():
+            return encoding, missing
+        if missing is None and not skip_marker(digest, encoding).exists():
+            missing = encoding
+    return None, missing
+
+
+def build_variant(digest: str, encoding: str):
+    key = (digest, encoding)
+    with building_lock:
+        if key in building:
+            return
+        building.add(key)
+    try:
+        source_path = blob_path(digest)
+        destination = variant_path(digest, encoding)
+        temporary = destination.with_name(
+            f".{destination.name}.{uuid.uuid4().hex}"
+        )
+        _, compress = ENCODERS[encoding]
+        try:
+            with open(source_path, "rb") as source, \
+                    open(temporary, "wb") as compressed:
+                compress(source, compressed)
+            original_size = source_path.stat().st_size
+            if temporary.stat().st_size > original_size * (
+                1 - MIN_COMPRESSION_SAVING
+            ):
+                skip_marker(digest, encoding).touch()
+            else:
+                os.replace(temporary, destination)
+        finally:
+            temporary.unlink(missing_ok=True)
+    finally:
+        with building_lock:
+            building.discard(key)
+
+
+def remove_variants(digest: str):
+    for path in blob_path(digest).parent.glob(f"{digest}.*"):
+        path.unlink(missing_ok=True)
@@ -0,0 +1,220 @@
+import json
+import os
+import re
+import uuid
+
+import anyio
+from fastapi import APIRouter, Header, HTTPException, Request, Response
+from pydantic import BaseModel, Field
+from starlette.requests import ClientDisconnect
+
+from file_index import file_index
+from storage import (
+    MAX_UPLOAD_SIZE,
+    UPLOAD_DIR,
+    StagedUpload,
+    content_type_for,
+    hash_file,
+    validate_filename,
+)
+
+# Each session is a <id>.part data file plus a <id>.json state file
+# recording the last offset known to be on disk; PATCH requests resume
+# from that offset after a dropped connection or a restart
+SESSION_DIR = UPLOAD_DIR / ".sessions"
+UPLOAD_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+router = APIRouter(prefix="/uploads", tags=["resumable uploads"])
+
+# Sessions with a PATCH or finalize in progress; one at a time per session
+active_uploads: set[str] = set()
+
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int = Field(ge=0)
+
+
+class UploadSession(BaseModel):
+    upload_id: str
+    filename: str
+    size: int
+    offset: int
+    # Set before the file is indexed, so a retried finalize repeats the
+    # indexing if it was cut short and otherwise answers as the first did
+    finalized: bool = False
+
+
+def session_paths(upload_id: str):
+    if not UPLOAD_ID_PATTERN.fullmatch(upload_id):
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return (
+        SESSION_DIR / f"{upload_id}.json",
+        SESSION_DIR / f"{upload_id}.part",
+    )
+
+
+def write_state(session: UploadSession):
+    state_path, _ = session_paths(session.upload_id)
+    temporary = state_path.with_suffix(".json.tmp")
+    with open(temporary, "w") as state:
+        state.write(session.model_dump_json())
+        state.flush()
+        os.fsync(state.fileno())
+    os.replace(temporary, state_path)
+
+
+def read_state(upload_id: str) -> UploadSession:
+    state_path, _ = session_paths(upload_id)
+    try:
+        with open(state_path) as state:
+            return UploadSession(**json.load(state))
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+
+def offset_headers(session: UploadSession) -> dict:
+    return {
+        "Upload-Offset": str(session.offset),
+        "Upload-Length": str(session.size),
+    }
+
+
+@router.post("", status_code=201)
+async def create_upload(body: UploadSessionCreate) -> UploadSession:
+    validate_filename(body.filename)
+    if body.size > MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=413, detail="File too large")
+    session = UploadSession(
+        upload_id=uuid.uuid4().hex,
+        filename=body.filename,
+        size=body.size,
+        offset=0,
+    )
+    _, data_path = session_paths(session.upload_id)
+
+    def create():
+        SESSION_DIR.mkdir(parents=True, exist_ok=True)
+        data_path.touch()
+        write_state(session)
+
+    await anyio.to_thread.run_sync(create)
+    return session
+
+
+@router.get("/{upload_id}")
+async def read_upload(upload_id: str, response: Response) -> UploadSession:
+    session = await anyio.to_thread.run_sync(read_state, upload_id)
+    response.headers.update(offset_headers(session))
+    return session
+
+
+@router.patch("/{upload_id}")
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    response: Response,
+    upload_offset: int = Header(...),
+) -> UploadSession:
+    if upload_id in active_uploads:
+        raise HTTPException(
+            status_code=409,
+            detail="Another chunk is being written to this upload"
+        )
+    active_uploads.add(upload_id)
+    try:
+        session = await anyio.to_thread.run_sync(read_state, upload_id)
+        if session.finalized:
+            raise HTTPException(
+                status_code=409, detail="Upload already finalized"
+            )
+        if upload_offset != session.offset:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Expected Upload-Offset {session.offset}",
+                headers=offset_headers(session),
+            )
+        _, data_path = session_paths(upload_id)
+        offset = session.offset
+        async with await anyio.open_file(data_path, "r+b") as data:
+            # Bytes past the acknowledged offset were never confirmed to
+            # the client, so they are dropped and written again
+            await data.truncate(offset)
+            await data.seek(offset)
+            try:
+                async for chunk in request.stream():
+                    if offset + len(chunk) > session.size:
+                        raise HTTPException(
+                            status_code=413,
+                            detail="Chunk goes past the declared size",
+                            headers=offset_headers(session),
+                        )
+                    await data.write(chunk)
+                    offset += len(chunk)
+            except ClientDisconnect:
+                # Keep whatever arrived; the client resumes from there
+                pass
+            await data.flush()
+            await anyio.to_thread.run_sync(os.fsync, data.wrapped.fileno())
+        session.offset = offset
+        await anyio.to_thread.run_sync(write_state, session)
+    finally:
+        active_uploads.discard(upload_id)
+    response.headers.update(offset_headers(session))
+    return session
+
+
+@router.post("/{upload_id}/finalize")
+async def finalize_upload(upload_id: str):
+    if upload_id in active_uploads:
+        raise HTTPException(
+            status_code=409,
+            detail="This upload is still being written or finalized"
+        )
+    active_uploads.add(upload_id)
+    try:
+        session = await anyio.to_thread.run_sync(read_state, upload_id)
+        if session.offset != session.size:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Upload incomplete: {session.offset} of {session.size}",
+                headers=offset_headers(session),
+            )
+        _, data_path = session_paths(upload_id)
+
+        def finalize():
+            if not session.finalized:
+                session.finalized = True
+                write_state(session)
+            elif not data_path.exists():
+                return
+            staged = StagedUpload(
+                path=data_path,
+                digest=hash_file(data_path),
+                size=session.size,
+                content_type=content_type_for(session.filename),
+            )
+            file_index.add(validate_filename(session.filename), staged)
+
+        await anyio.to_thread.run_sync(finalize)
+    finally:
+        active_uploads.discard(upload_id)
+    return {"filename": session.filename}
+
+
+@router.delete("/{upload_id}")
+async def abort_upload(upload_id: str):
+    if upload_id in active_uploads:
+        raise HTTPException(
+            status_code=409,
+            detail="This upload is still being written or finalized"
+        )
+    state_path, data_path = session_paths(upload_id)
+    await anyio.to_thread.run_sync(read_state, upload_id)
+
+    def abort():
+        state_path.unlink(missing_ok=True)
+        data_path.unlink(missing_ok=True)
+
+    await anyio.to_thread.run_sync(abort)
+    return {"detail": "Upload aborted"}
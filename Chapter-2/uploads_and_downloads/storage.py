@@ -0,0 +1,202 @@
+import hashlib
+import mimetypes
+import os
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+
+import anyio
+from fastapi import HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "uploads"))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 1024 * 1024 * 1024))
+
+# Content lives in BLOB_DIR under its SHA-256; uploads are written to
+# STAGING_DIR first, on the same filesystem, so they can be renamed in
+BLOB_DIR = UPLOAD_DIR / ".blobs"
+STAGING_DIR = UPLOAD_DIR / ".staging"
+
+
+@dataclass
+class StagedUpload:
+    path: Path
+    digest: str
+    size: int
+    content_type: str = "application/octet-stream"
+
+
+def validate_filename(filename: str) -> str:
+    # Only the last path component is kept, so names like "../x" are
+    # stored as "x"
+    name = Path(filename).name
+    if name in ("", ".", ".."):
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    return name
+
+
+def content_type_for(filename: str, declared: str | None = None) -> str:
+    media_type, _ = mimetypes.guess_type(filename)
+    return media_type or declared or "application/octet-stream"
+
+
+def blob_path(digest: str) -> Path:
+    return BLOB_DIR / digest[:2] / digest
+
+
+def staging_path() -> Path:
+    STAGING_DIR.mkdir(parents=True, exist_ok=True)
+    return STAGING_DIR / f"{uuid.uuid4().hex}.part"
+
+
+def hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as source:
+        while chunk := source.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FilePartReader:
+    # Collects the multipart parser's callbacks: the data of the first part
+    # named `field` that carries a filename is queued in `pending`, the
+    # data of every other part is dropped
+    def __init__(self, field: str):
+        self.field = field
+        self.headers: dict[bytes, bytes] = {}
+        self.header_field = b""
+        self.header_value = b""
+        self.filename: str | None = None
+        self.content_type: str | None = None
+        self.receiving = False
+        self.finished = False
+        self.pending: list[bytes] = []
+        self.pending_size = 0
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self.headers = {}
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self.header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self.header_value += data[start:end]
+
+    def on_header_end(self):
+        self.headers[self.header_field.lower()] = self.header_value
+        self.header_field = self.header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(
+            self.headers.get(b"content-disposition", b"")
+        )
+        filename = options.get(b"filename")
+        if (
+            self.filename is None
+            and options.get(b"name") == self.field.encode()
+            and filename is not None
+        ):
+            self.filename = filename.decode("utf-8", "replace")
+            declared = self.headers.get(b"content-type")
+            self.content_type = declared.decode("latin-1") if declared else None
+            self.receiving = True
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self.receiving:
+            self.pending.append(data[start:end])
+            self.pending_size += end - start
+
+    def on_part_end(self):
+        if self.receiving:
+            self.receiving = False
+            self.finished = True
+
+    def take_pending(self) -> list[bytes]:
+        chunks, self.pending, self.pending_size = self.pending, [], 0
+        return chunks
+
+
+async def save_upload(
+    request: Request, field: str = "file"
+) -> tuple[str, StagedUpload]:
+    # The multipart body is parsed as it arrives and the file part goes
+    # straight into the staging file, hashed in the same worker thread
+    # call as the write, so it is never spooled or read back
+    _, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if not boundary:
+        raise HTTPException(
+            status_code=400, detail="Expected a multipart/form-data body"
+        )
+    reader = FilePartReader(field)
+    parser = MultipartParser(boundary, reader.callbacks())
+
+    temporary = await anyio.to_thread.run_sync(staging_path)
+    digest = hashlib.sha256()
+    size = 0
+    name = None
+
+    def write_chunks(buffer, chunks: list[bytes]):
+        for chunk in chunks:
+            buffer.write(chunk)
+            digest.update(chunk)
+
+    try:
+        buffer = await anyio.to_thread.run_sync(open, temporary, "wb")
+        try:
+            async for data in request.stream():
+                try:
+                    parser.write(data)
+                except MultipartParseError:
+                    raise HTTPException(
+                        status_code=400, detail="Invalid multipart body"
+                    )
+                if name is None and reader.filename is not None:
+                    name = validate_filename(reader.filename)
+                if size + reader.pending_size > MAX_UPLOAD_SIZE:
+                    raise HTTPException(
+                        status_code=413,
+                        detail="File too large"
+                    )
+                if reader.pending_size >= UPLOAD_CHUNK_SIZE or (
+                    reader.finished and reader.pending
+                ):
+                    size += reader.pending_size
+                    await anyio.to_thread.run_sync(
+                        write_chunks, buffer, reader.take_pending()
+                    )
+            parser.finalize()
+            if not reader.finished:
+                raise RequestValidationError([{
+                    "type": "missing",
+                    "loc": ("body", field),
+                    "msg": "Field required",
+                    "input": None,
+                }])
+        finally:
+            await anyio.to_thread.run_sync(buffer.close)
+    except BaseException:
+        await anyio.to_thread.run_sync(
+            lambda: temporary.unlink(missing_ok=True)
+        )
+        raise
+    return name, StagedUpload(
+        path=temporary,
+        digest=digest.hexdigest(),
+        size=size,
+        content_type=content_type_for(reader.filename, reader.content_type),
+    )
@@ -50,3 +50,6 @@ def create_test_database():
             print("")
         yield csv_test
         os.remove(database_file_location)
+        journal_location = f"{database_file_location}.journal"
+        if os.path.exists(journal_location):
+            os.remove(journal_location)
@@ -1,4 +1,8 @@
 import csv
+import json
+import logging
+import os
+import threading
 from typing import Optional
 from model import (Task, TaskWithID, TaskV2WithID)
 
@@ -6,80 +10,317 @@ DATABASE_FILENAME = "tasks.csv"
 
 column_fields = ["id", "title", "description", "status"]
 
+# Mutations are appended to <csv>.journal; once this many have
+# accumulated, a background thread folds them into a new CSV snapshot
+JOURNAL_COMPACT_AFTER = int(os.getenv("TASKS_JOURNAL_COMPACT_AFTER", 1000))
+
+logger = logging.getLogger("uvicorn.error")
+
+def file_signature(filename: str):
+    try:
+        stat_result = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return [stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns]
+
+def csv_row(row: dict | None) -> dict | None:
+    # A row as it reads back from the CSV, so rows from the journal and
+    # rows from the file can be compared
+    if row is None:
+        return None
+    return {
+        key: "" if value is None else str(value)
+        for key, value in row.items()
+    }
+
+def record_task_id(record: dict) -> int:
+    if record["op"] == "put":
+        return int(record["row"]["id"])
+    return record["id"]
+
+def fsync_directory(filename: str):
+    # Makes a rename inside the file's directory durable
+    descriptor = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+class TaskRepository:
+    # Loads the CSV snapshot and its journal once and answers reads from
+    # memory. Each change appends one journal record; the snapshot is
+    # only ever replaced whole, by renaming a finished file into place.
+    # Both files are read again when their inode, size or mtime shows
+    # they were changed by someone else; a row edited in the CSV that
+    # also has journal records keeps the edit, and the journal is folded
+    # in right away so the records it overrode are not replayed later
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.journal_filename = f"{filename}.journal"
+        self.lock = threading.RLock()
+        self.compaction_lock = threading.Lock()
+        self.fieldnames = list(column_fields)
+        self.rows: dict[int, dict] = {}
+        self.csv_rows: dict[int, dict] = {}
+        self.tasks: dict[int, TaskWithID] = {}
+        self.signature = None
+        self.journal_records = 0
+        self.journal_size = 0
+        self.loads = 0
+        self.compacting = False
+
+    def _signature(self):
+        return (
+            file_signature(self.filename),
+            file_signature(self.journal_filename),
+        )
+
+    def _refresh(self):
+        signature = self._signature()
+        if signature == self.signature:
+            return
+        csv_edited = (
+            self.signature is not None and signature[0] != self.signature[0]
+        )
+        previous_csv_rows = self.csv_rows
+        self.rows = {}
+        self.tasks = {}
+        if signature[0] is not None:
+            with open(self.filename, newline="") as csvfile:
+                reader = csv.DictReader(csvfile)
+                self.fieldnames = list(reader.fieldnames or column_fields)
+                for row in reader:
+                    self._apply({"op": "put", "row": row})
+        self.csv_rows = dict(self.rows)
+        edited = set()
+        if csv_edited:
+            edited = {
+                task_id
+                for task_id in previous_csv_rows.keys() | self.csv_rows.keys()
+                if csv_row(previous_csv_rows.get(task_id))
+                != csv_row(self.csv_rows.get(task_id))
+            }
+        overridden = self._replay_journal(edited)
+        self.signature = self._signature()
+        self.loads += 1
+        if overridden:
+            logger.warning(
+                f"{self.filename} was edited outside the app; kept the "
+                f"edits over {len(overridden)} journaled change(s) to "
+                f"task(s) {sorted(overridden)}"
+            )
+            temporary = self._write_snapshot(
+                list(self.rows.values()), self.fieldnames
+            )
+            self._install(temporary, b"")
+            self.csv_rows = dict(self.rows)
+            self.journal_records = 0
+
+    def _apply(self, record: dict):
+        if record["op"] == "put":
+            task = TaskWithID(**record["row"])
+            self.rows[task.id] = record["row"]
+            self.tasks[task.id] = task
+        else:
+            self.rows.pop(record["id"], None)
+            self.tasks.pop(record["id"], None)
+
+    def _replay_journal(self, edited: set[int]) -> set[int]:
+        # Records hold whole rows or deletes by id, so replaying them
+        # over a CSV that already contains their effect (a compaction
+        # that crashed between its renames, or a CSV edited by hand)
+        # ends in the same state. Records for the rows in `edited` are
+        # skipped and their ids returned
+        overridden = set()
+        self.journal_records = 0
+        self.journal_size = 0
+        try:
+            journal = open(self.journal_filename, "rb+")
+        except FileNotFoundError:
+            return overridden
+        with journal:
+            applied = 0
+            while line := journal.readline():
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                if record is None or not line.endswith(b"\n"):
+                    # A record torn by a crash; it was never acknowledged
+                    journal.truncate(applied)
+                    break
+                if record_task_id(record) in edited:
+                    overridden.add(record_task_id(record))
+                else:
+                    self._apply(record)
+                self.journal_records += 1
+                applied = journal.tell()
+            self.journal_size = applied
+        return overridden
+
+    def _row(self, task: TaskWithID) -> dict:
+        # Columns this model does not know about, such as the v2
+        # priority, are kept as they are
+        return {**self.rows.get(task.id, {}), **task.model_dump()}
+
+    def _append(self, record: dict):
+        line = json.dumps(record).encode() + b"\n"
+        with open(self.journal_filename, "ab") as journal:
+            journal.write(line)
+            journal.flush()
+            os.fsync(journal.fileno())
+        self._apply(record)
+        self.journal_records += 1
+        self.journal_size += len(line)
+        self.signature = self._signature()
+        if self.journal_records >= JOURNAL_COMPACT_AFTER and not self.compacting:
+            self.compacting = True
+            threading.Thread(target=self.compact, daemon=True).start()
+
+    def _write_snapshot(self, rows: list[dict], fieldnames: list[str]) -> str:
+        temporary = f"{self.filename}.tmp"
+        with open(temporary, mode="w", newline="") as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+            csvfile.flush()
+            os.fsync(csvfile.fileno())
+        return temporary
+
+    def compact(self):
+        # The snapshot is written without holding the lock; the records
+        # appended meanwhile are carried over into the new journal, so
+        # the lock is only held for the renames
+        with self.compaction_lock:
+            try:
+                self._compact()
+            finally:
+                self.compacting = False
+
+    def _compact(self):
+        with self.lock:
+            self._refresh()
+            loads = self.loads
+            journal_size = self.journal_size
+            journal_records = self.journal_records
+            rows = dict(self.rows)
+            fieldnames = list(self.fieldnames)
+        temporary = self._write_snapshot(list(rows.values()), fieldnames)
+        with self.lock:
+            self._refresh()
+            if self.loads != loads:
+                # The files were changed by someone else meanwhile, so
+                # the snapshot may be missing their changes
+                os.remove(temporary)
+                return
+            try:
+                with open(self.journal_filename, "rb") as journal:
+                    journal.seek(journal_size)
+                    tail = journal.read()
+            except FileNotFoundError:
+                tail = b""
+            self._install(temporary, tail)
+            self.csv_rows = rows
+            self.journal_records -= journal_records
+
+    def _install(self, snapshot: str, journal_tail: bytes):
+        # The CSV rename is made durable before the journal is replaced;
+        # a crash in between only means the old journal is replayed over
+        # a CSV that already holds its records
+        os.replace(snapshot, self.filename)
+        fsync_directory(self.filename)
+        temporary = f"{self.journal_filename}.tmp"
+        with open(temporary, "wb") as journal:
+            journal.write(journal_tail)
+            journal.flush()
+            os.fsync(journal.fileno())
+        os.replace(temporary, self.journal_filename)
+        fsync_directory(self.journal_filename)
+        self.journal_size = len(journal_tail)
+        self.signature = self._signature()
+
+    def all(self) -> list[TaskWithID]:
+        with self.lock:
+            self._refresh()
+            return list(self.tasks.values())
+
+    def all_v2(self) -> list[TaskV2WithID]:
+        with self.lock:
+            self._refresh()
+            return [TaskV2WithID(**row) for row in self.rows.values()]
+
+    def get(self, task_id: int) -> Optional[TaskWithID]:
+        with self.lock:
+            self._refresh()
+            return self.tasks.get(task_id)
+
+    def next_id(self) -> int:
+        with self.lock:
+            self._refresh()
+            return max(self.tasks, default=0) + 1
+
+    def add(self, task: TaskWithID):
+        with self.lock:
+            self._refresh()
+            self._append({"op": "put", "row": self._row(task)})
+
+    def update(self, task_id: int, fields: dict) -> Optional[TaskWithID]:
+        with self.lock:
+            self._refresh()
+            if task_id not in self.tasks:
+                return None
+            updated_task = self.tasks[task_id].model_copy(update=fields)
+            self._append({"op": "put", "row": self._row(updated_task)})
+            return updated_task
+
+    def remove(self, task_id: int) -> Optional[TaskWithID]:
+        with self.lock:
+            self._refresh()
+            if task_id not in self.tasks:
+                return None
+            deleted_task = self.tasks[task_id]
+            self._append({"op": "delete", "id": task_id})
+            return deleted_task
+
+_repositories: dict[str, TaskRepository] = {}
+
+def get_repository() -> TaskRepository:
+    # Looked up by name on every call, so pointing DATABASE_FILENAME at
+    # another file (as the tests do) switches repositories
+    if DATABASE_FILENAME not in _repositories:
+        _repositories[DATABASE_FILENAME] = TaskRepository(DATABASE_FILENAME)
+    return _repositories[DATABASE_FILENAME]
+
 def read_all_tasks() -> list[TaskWithID]:
-    with open(DATABASE_FILENAME) as csvfile:
-        reader = csv.DictReader(csvfile)
-        return [
-            TaskWithID(**row) for row in reader
-        ]
+    return get_repository().all()
         
 def read_task(task_id: int) -> Optional[TaskWithID]:
-    with open(DATABASE_FILENAME) as csvfile:
-        reader = csv.DictReader(csvfile)
-        
-        for row in reader:
-            if int(row["id"]) == task_id:
-                return TaskWithID(**row)
+    return get_repository().get(task_id)
 
 def get_next_id():
-    try:
-        with open(DATABASE_FILENAME, "r") as csvfile:
-            reader = csv.DictReader(csvfile)
-            max_id = max(int(row["id"]) for row in reader)
-           
-            return max_id + 1
-    except (FileNotFoundError, ValueError):  
-        return 1              
+    return get_repository().next_id()
 
 def write_task_into_csv (task: TaskWithID):    
-    with open(DATABASE_FILENAME, "a", newline="") as file:
-        writer = csv.DictWriter(file, fieldnames=column_fields)
-        writer.writerow(task.model_dump())
+    get_repository().add(task)
         
 def create_task(task: Task) -> TaskWithID:
-    id = get_next_id()
-    task_with_id = TaskWithID(id=id, **task.model_dump())
-    
-    write_task_into_csv(task_with_id)
+    # Held across both steps so concurrent creates get distinct ids
+    with get_repository().lock:
+        id = get_next_id()
+        task_with_id = TaskWithID(id=id, **task.model_dump())
+
+        write_task_into_csv(task_with_id)
     return task_with_id
 
 def modify_task(id: int, task: dict) -> Optional[TaskWithID]:
-    updated_task: Optional[TaskWithID] = None
-    tasks = read_all_tasks()
-    for number, _task in enumerate (tasks):
-        if _task.id == id:
-            updated_task = _task.model_copy(update=task)
-    with open (DATABASE_FILENAME, mode="w", newline="") as csvfile:     #rewrite the file
-        writer = csv.DictWriter(csvfile, fieldnames=column_fields)
-        writer.writeheader()
-        for task in tasks:
-            writer.writerow(task.model_dump())
+    return get_repository().update(id, task)
     
-    if updated_task:
-        return updated_task
-    
-def remove_task(id: int) -> bool:
-    deleted_task: Optional[Task] = None
-    tasks = read_all_tasks()    
-    with open (DATABASE_FILENAME, mode="w", newline="") as csvfile:     #rewrite the file
-        writer = csv.DictWriter(csvfile, fieldnames=column_fields)
-        writer.writeheader()
-
-        for task in tasks:
-            if task.id == id:
-                deleted_task = task
-                continue
-            writer.writerow(task.model_dump())
-            if deleted_task:
-                dict_task_without_id = (deleted_task.model_dump())
-                del dict_task_without_id["id"]
-                return Task(**dict_task_without_id)
+def remove_task(id: int) -> Optional[Task]:
+    deleted_task = get_repository().remove(id)
+    if deleted_task:
+        dict_task_without_id = (deleted_task.model_dump())
+        del dict_task_without_id["id"]
+        return Task(**dict_task_without_id)
             
 def read_all_tasks_v2() -> list[TaskV2WithID]:
-    with open(DATABASE_FILENAME) as csvfile:
-        reader = csv.DictReader(
-            csvfile,
-        )
-        return [TaskV2WithID(**row) for row in reader]
-          
-        
\ No newline at end of file
+    return get_repository().all_v2()
@@ -1,3 +1,9 @@
+import csv
+import os
+from unittest.mock import patch
+
+import operations
+from operations import TaskRepository
 from main import app
 from fastapi.testclient import TestClient
 from conftest import TEST_TASKS
@@ -51,4 +57,102 @@ def test_endpoint_delete_task():
     del expected_response["id"]
     
     assert response.json() == expected_response
-    assert read_task(2) is None
\ No newline at end of file
+    assert read_task(2) is None
+    
+def test_reads_are_served_from_memory():
+    client.get("/tasks")
+    with patch("operations.csv.DictReader") as reader:
+        assert len(client.get("/tasks").json()) == 2
+        assert client.get("/task/1").json() == TEST_TASKS[0]
+    reader.assert_not_called()
+    
+def test_external_edit_is_reloaded():
+    assert client.get("/task/3").status_code == 404
+    with open(operations.DATABASE_FILENAME, "a", newline="") as csvfile:
+        csvfile.write("3,Added Outside,Edited by hand,Incomplete\n")
+    response = client.get("/task/3")
+    assert response.status_code == 200
+    assert response.json()["title"] == "Added Outside"
+    
+def test_external_edit_keeps_journaled_changes():
+    client.post(
+        "/task",
+        json={"title": "Journaled", "description": "D", "status": "Ready"},
+    )
+    with open(operations.DATABASE_FILENAME, "a", newline="") as csvfile:
+        csvfile.write("5,Added Outside,Edited by hand,Incomplete\n")
+    assert sorted(task.id for task in read_all_tasks()) == [1, 2, 3, 5]
+    assert read_task(3).title == "Journaled"
+    reloaded = TaskRepository(operations.DATABASE_FILENAME)
+    assert sorted(task.id for task in reloaded.all()) == [1, 2, 3, 5]
+
+
+def test_external_edit_wins_over_journaled_change():
+    client.put("/task/1", json={"title": "Journaled"})
+    client.put("/task/2", json={"status": "Finished"})
+    with open(operations.DATABASE_FILENAME) as csvfile:
+        rows = list(csv.DictReader(csvfile))
+    rows[0]["title"] = "Edited by hand"
+    with open(operations.DATABASE_FILENAME, "w", newline="") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=rows[0].keys())
+        writer.writeheader()
+        writer.writerows(rows)
+    assert read_task(1).title == "Edited by hand"
+    assert read_task(2).status == "Finished"
+    reloaded = TaskRepository(operations.DATABASE_FILENAME)
+    assert reloaded.get(1).title == "Edited by hand"
+    assert reloaded.get(2).status == "Finished"
+    
+def test_mutations_append_to_journal():
+    csv_before = os.stat(operations.DATABASE_FILENAME)
+    client.post(
+        "/task",
+        json={"title": "T", "description": "D", "status": "Ready"},
+    )
+    client.put("/task/1", json={"status": "Finished"})
+    client.delete("/task/2")
+    csv_after = os.stat(operations.DATABASE_FILENAME)
+    assert csv_after.st_mtime_ns == csv_before.st_mtime_ns
+    with open(f"{operations.DATABASE_FILENAME}.journal") as journal:
+        assert len(journal.readlines()) == 3
+    reloaded = TaskRepository(operations.DATABASE_FILENAME)
+    assert [task.id for task in reloaded.all()] == [1, 3]
+    assert reloaded.get(1).status == "Finished"
+    
+def test_compaction_folds_journal_into_csv():
+    client.put("/task/1", json={"status": "Finished"})
+    client.delete("/task/2")
+    operations.get_repository().compact()
+    with open(operations.DATABASE_FILENAME) as csvfile:
+        rows = list(csv.DictReader(csvfile))
+    assert [(row["id"], row["status"]) for row in rows] == [("1", "Finished")]
+    with open(f"{operations.DATABASE_FILENAME}.journal") as journal:
+        assert journal.readlines() == []
+    client.put("/task/1", json={"title": "After compaction"})
+    reloaded = TaskRepository(operations.DATABASE_FILENAME)
+    assert reloaded.get(1).title == "After compaction"
+    assert reloaded.get(2) is None
+
+def test_compaction_keeps_changes_made_while_it_runs():
+    repository = operations.get_repository()
+    client.put("/task/1", json={"status": "Finished"})
+    write_snapshot = repository._write_snapshot
+
+    def write_snapshot_then_delete(rows, fieldnames):
+        temporary = write_snapshot(rows, fieldnames)
+        client.delete("/task/2")
+        return temporary
+
+    with patch.object(
+        repository, "_write_snapshot", write_snapshot_then_delete
+    ):
+        repository.compact()
+    with open(operations.DATABASE_FILENAME) as csvfile:
+        rows = list(csv.DictReader(csvfile))
+    assert [(row["id"], row["status"]) for row in rows] == [
+        ("1", "Finished"), ("2", "Complete")
+    ]
+    with open(f"{operations.DATABASE_FILENAME}.journal") as journal:
+        assert len(journal.readlines()) == 1
+    reloaded = TaskRepository(operations.DATABASE_FILENAME)
+    assert [task.id for task in reloaded.all()] == [1]